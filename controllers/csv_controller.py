@@ -1,21 +1,46 @@
 from services.csv_service import CSVService, CSVServiceError
-from models.csv_model import CSVData
-from typing import Dict, List, Tuple, Optional, Any
-from datetime import datetime, timedelta, time
+from services.cache_service import ParsedFileCache
+from models.csv_model import CSVData, DayProfile, DeviceSeries, MinuteAggregate
+from models.analysis_model import AnalysisSnapshot, CalendarSimulation, ProfileMatrix
+from typing import Dict, Iterable, List, Tuple, Optional, Any
+from datetime import date, datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
 import pandas as pd
 import openpyxl
 from openpyxl.drawing.image import Image as ExcelImage
+import numpy as np
 import io
+import json
+import os
 import re
-import statistics
 
 class CSVContext:
     def __init__(self):
         self.data: CSVData | None = None
         self.device_columns: Dict = {}
-        self.analysis_cache: Dict = {}
+        self.device_index: Dict[str, Tuple[Optional[int], int]] = {}
+        self.series: Dict[str, DeviceSeries] = {}
+        # Modo agregado: en lugar de las filas crudas se conserva un agregado por minuto por dispositivo
+        self.aggregates: Dict[str, MinuteAggregate] = {}
+        # Perfiles diarios ya calculados: (dispositivo, tipo de día, hash de la config) -> vector
+        self.analysis_cache: Dict[Tuple[str, str, int], np.ndarray] = {}
         self.device_configs: Dict[str, Dict[str, Any]] = {}
         self.device_meta: Dict[str, Dict[str, Any]] = {}
+        self.source_path: str | None = None
+        self.source_rows: int = 0
+
+    def __getstate__(self):
+        # El índice por dispositivo y los perfiles en caché no se guardan: se recalculan al pedirlos
+        state = self.__dict__.copy()
+        state.pop('series', None)
+        state.pop('analysis_cache', None)
+        return state
+
+    def __setstate__(self, state):
+        # Proyectos guardados con versiones anteriores no traen los atributos nuevos
+        self.__init__()
+        self.__dict__.update(state)
 
 class CSVController:
     def __init__(self):
@@ -29,87 +54,182 @@ class CSVController:
         }
         self.last_warning: str | None = None
         self.VOLTAGE = 120.0 
+        self.DATE_SAMPLE_ROWS = 2000
+        self.PROFILE_DATE_FORMAT = "%d/%m/%Y %H:%M:%S"
+        self.CYCLE_OVERLAP = 'mean'
+        self.AC_PEAK_SAMPLES = 100
+        self.AC_STABLE_WINDOW = 10
+        self.AC_PATTERN_SAMPLES = 60
+        self.NEVERA_FILL = 'clone'
+        self.NEVERA_MAX_PERIOD = 360
+        # Segundos por ranura de los perfiles típicos (60 = 1440 ranuras de un minuto)
+        self.RESOLUTION = 60
+        # Procesos para calcular perfiles en paralelo (0 o 1 = en serie; por defecto uno por núcleo) y mínimo
+        # de muestras pendientes para usarlos (por debajo, copiar las series al bloque compartido y repartir
+        # las tareas cuesta más de lo que ahorran los demás núcleos)
+        self.PROFILE_WORKERS = os.cpu_count() or 1
+        self.PARALLEL_MIN_SAMPLES = 2_000_000
+        # Ingesta agregada por minuto (logs de alta frecuencia) y agregados parciales que se acumulan antes de combinarlos
+        self.AGGREGATE_INGEST = False
+        self.AGGREGATE_MERGE_PARTS = 64
+        # Festivos: la simulación de calendario los trata como días de fin de semana
+        self.HOLIDAYS: set = set()
+        self.file_cache: ParsedFileCache | None = ParsedFileCache()
+        self.cache_stats = {'hits': 0, 'misses': 0}
+        self.ANALYSIS_CONTEXTS = ['hora_exacta', 'ciclos', 'escalones', 'aires']
+        # Se incrementa con cada cambio de datos o configuración (invalida las vistas agregadas)
+        self.generation = 0
+        # Última generación que exige rehacer todo el análisis (carga de datos o parámetros globales);
+        # los cambios de horario de un solo dispositivo solo lo marcan en _dirty_devices
+        self._structure_generation = 0
+        self._dirty_devices: set = set()
+        self._snapshot: AnalysisSnapshot | None = None
+        # Ejes de tiempo compartidos (datetime64[s], solo lectura): 'day', 'week' y etiquetas de las ranuras
+        self._axes: Dict[str, Any] = {}
+        self._simulation: Tuple[Any, CalendarSimulation] | None = None
+        # Pool de procesos de la sesión, bloque de memoria compartida con las series y perfiles
+        # calculados por el pool que aún no pasaron por _day_vector
+        self._pool: ProcessPoolExecutor | None = None
+        self._pool_block: Tuple[Tuple, shared_memory.SharedMemory, Dict] | None = None
+        self._pool_calls = 0
+        self._prefetched: Dict[Tuple[str, Tuple], np.ndarray] = {}
 
     # =========================================================================
     #  MÉTODOS DE CÁLCULO
     # =========================================================================
+    def get_analysis_snapshot(self) -> AnalysisSnapshot:
+        # Perfiles, resumen semanal, Pareto mensual y totales en una sola pasada;
+        # todos los consumidores lo reutilizan hasta el próximo cambio de generación.
+        # Si desde entonces solo cambiaron horarios de algunos dispositivos, se recalculan
+        # esos dispositivos y se aplica la diferencia sobre el snapshot anterior
+        snap = self._snapshot
+        if snap is not None and snap.generation == self.generation: return snap
+        if snap is None or snap.generation < self._structure_generation:
+            snap = self._build_snapshot()
+        else:
+            snap = self._patch_snapshot(snap, self._dirty_devices)
+        self._dirty_devices = set()
+        self._snapshot = snap
+        return snap
+
+    def _build_snapshot(self) -> AnalysisSnapshot:
+        keys = [(k, dev) for k in self.ANALYSIS_CONTEXTS for dev in self.get_devices(k)]
+        self._prefetched = self._prefetch_profiles(keys)
+        mats = {}
+        try:
+            for day_type in ('weekday', 'weekend'):
+                rows = [self._day_vector(k, dev, day_type) for k, dev in keys]
+                mats[day_type] = np.vstack(rows) if rows else np.zeros((0, self._slots()))
+        finally:
+            self._prefetched = {}
+        matrix = ProfileMatrix(keys, mats['weekday'], mats['weekend'], self.generation)
+        energy = np.array([[self.get_daily_energy(k, dev, 'weekday'), self.get_daily_energy(k, dev, 'weekend')]
+                           for k, dev in keys]).reshape(-1, 2)
+        summary_rows = [self._summary_row(k, dev, wd, we) for (k, dev), (wd, we) in zip(keys, energy.tolist())]
+        return self._make_snapshot(matrix, energy, energy.sum(axis=0), summary_rows)
+
+    def _patch_snapshot(self, snap: AnalysisSnapshot, devices) -> AnalysisSnapshot:
+        matrix = snap.matrix
+        changed = sorted(matrix.index[key] for key in devices if key in matrix.index)
+        mats, totals = {}, {}
+        for day_type in ('weekday', 'weekend'):
+            mat, total = matrix.matrix(day_type).copy(), matrix.totals[day_type].copy()
+            for i in changed:
+                row = self._day_vector(*matrix.keys[i], day_type)
+                total += row - mat[i]
+                mat[i] = row
+            mats[day_type], totals[day_type] = mat, total
+        new_matrix = ProfileMatrix(matrix.keys, mats['weekday'], mats['weekend'], self.generation, totals)
+
+        energy, energy_totals = snap.energy.copy(), snap.energy_totals.copy()
+        summary_rows = list(snap.summary_rows)
+        for i in changed:
+            ctx, dev = matrix.keys[i]
+            new = np.array([self.get_daily_energy(ctx, dev, 'weekday'), self.get_daily_energy(ctx, dev, 'weekend')])
+            energy_totals += new - energy[i]
+            energy[i] = new
+            summary_rows[i] = self._summary_row(ctx, dev, *new.tolist())
+        return self._make_snapshot(new_matrix, energy, energy_totals, summary_rows)
+
+    def _make_snapshot(self, matrix, energy, energy_totals, summary_rows) -> AnalysisSnapshot:
+        # El Pareto se arma desde las filas del resumen (sin recalcular perfiles): los nombres
+        # pueden repetirse entre secciones y cada fila cuenta por separado
+        ranking = self._monthly_ranking(summary_rows)
+        month_kwh = sum(r['total_week'] * 4 for r in summary_rows)
+        wd, we = energy_totals.tolist()
+        grand_totals = {'daily_wd': wd, 'daily_we': we, 'total_5d': wd * 5, 'total_2d': we * 2, 'total_week': wd * 5 + we * 2}
+        totals = {k: round(v, 4) for k, v in grand_totals.items()}
+        return AnalysisSnapshot(self.generation, matrix, energy, energy_totals, summary_rows, totals,
+                                self._pareto_rows(ranking, month_kwh), round(month_kwh, 4))
+
     def get_monthly_projection(self) -> Tuple[List[Dict], float]:
-        rows, totals = self.get_energy_summary()
+        snap = self.get_analysis_snapshot()
+        return [dict(r) for r in snap.monthly_rows], snap.monthly_total
+
+    def get_energy_summary(self) -> Tuple[List[Dict], Dict]:
+        snap = self.get_analysis_snapshot()
+        return [dict(r) for r in snap.summary_rows], dict(snap.totals)
+
+    def _summary_row(self, ctx: str, dev: str, kwh_day_wd: float, kwh_day_we: float) -> Dict:
+        total_5d = kwh_day_wd * 5
+        total_2d = kwh_day_we * 2
+        total_week = total_5d + total_2d
+        return {
+            'section': ctx.replace('_', ' ').title(),
+            'device': dev,
+            'daily_wd': round(kwh_day_wd, 4),
+            'daily_we': round(kwh_day_we, 4),
+            'total_5d': round(total_5d, 4),
+            'total_2d': round(total_2d, 4),
+            'total_week': round(total_week, 4)
+        }
+
+    def _pareto_name(self, device_name: str) -> str:
+        name = device_name.lower()
+        if "luminaria" in name or "iluminacion" in name or "iluminación" in name: return 'Iluminación (Agrupada)'
+        return device_name
+
+    def _monthly_ranking(self, rows: List[Dict]) -> List[Tuple[str, float]]:
         temp_list = []
-        grand_total_month = 0.0
         luminarias_total = 0.0
         found_luminarias = False
         
         for r in rows:
             month_kwh = r['total_week'] * 4
-            grand_total_month += month_kwh
-            name = r['device']
-            if "luminaria" in name.lower() or "iluminacion" in name.lower() or "iluminación" in name.lower():
+            name = self._pareto_name(r['device'])
+            if name != r['device']:
                 luminarias_total += month_kwh
                 found_luminarias = True
             else:
-                temp_list.append({'device': name, 'kwh_month': month_kwh})
+                temp_list.append((name, month_kwh))
         
         if found_luminarias:
-            temp_list.append({'device': 'Iluminación (Agrupada)', 'kwh_month': luminarias_total})
+            temp_list.append(('Iluminación (Agrupada)', luminarias_total))
             
-        temp_list.sort(key=lambda x: x['kwh_month'], reverse=True)
-        
+        temp_list.sort(key=lambda x: x[1], reverse=True)
+        return temp_list
+
+    def _pareto_rows(self, ranking: List[Tuple[str, float]], grand_total_month: float) -> List[Dict]:
         final_rows = []
         accumulated_kwh = 0.0
-        for item in temp_list:
-            kwh = item['kwh_month']
+        for device, kwh in ranking:
             accumulated_kwh += kwh
             rel_energy = (kwh / grand_total_month * 100) if grand_total_month > 0 else 0.0
             acc_rel = (accumulated_kwh / grand_total_month * 100) if grand_total_month > 0 else 0.0
             final_rows.append({
-                'device': item['device'],
+                'device': device,
                 'kwh_month': round(kwh, 4),
                 'rel_energy': round(rel_energy, 2),
                 'acc_kwh': round(accumulated_kwh, 4),
                 'acc_rel': round(acc_rel, 2)
             })
-        return final_rows, round(grand_total_month, 4)
-
-    def get_energy_summary(self) -> Tuple[List[Dict], Dict]:
-        summary_rows = []
-        grand_totals = {'daily_wd': 0.0, 'daily_we': 0.0, 'total_5d': 0.0, 'total_2d': 0.0, 'total_week': 0.0}
-        factor = 1.0 / 60000.0
-
-        for ctx in ['hora_exacta', 'ciclos', 'escalones', 'aires']:
-            devices = self.get_devices(ctx)
-            for dev in devices:
-                _, p_wd = self.get_typical_day_profile(ctx, dev, 'weekday')
-                _, p_we = self.get_typical_day_profile(ctx, dev, 'weekend')
-                
-                kwh_day_wd = sum(p_wd) * factor
-                kwh_day_we = sum(p_we) * factor
-                total_5d = kwh_day_wd * 5
-                total_2d = kwh_day_we * 2
-                total_week = total_5d + total_2d
-                
-                summary_rows.append({
-                    'section': ctx.replace('_', ' ').title(),
-                    'device': dev,
-                    'daily_wd': round(kwh_day_wd, 4),
-                    'daily_we': round(kwh_day_we, 4),
-                    'total_5d': round(total_5d, 4),
-                    'total_2d': round(total_2d, 4),
-                    'total_week': round(total_week, 4)
-                })
-                grand_totals['daily_wd'] += kwh_day_wd
-                grand_totals['daily_we'] += kwh_day_we
-                grand_totals['total_5d'] += total_5d
-                grand_totals['total_2d'] += total_2d
-                grand_totals['total_week'] += total_week
-        
-        for k in grand_totals: grand_totals[k] = round(grand_totals[k], 4)
-        return summary_rows, grand_totals
+        return final_rows
 
     # --- GESTIÓN DE MEMORIA ---
     def set_device_config_simple(self, context_key, device_name, count, starts, ends=None):
         if context_key in self.contexts:
             self.contexts[context_key].device_configs[device_name] = {'type': 'simple', 'count': count, 'starts': starts, 'ends': ends or []}
+            self._invalidate_device(context_key, device_name)
     def set_device_config_weekly(self, context_key, device_name, wd_count, wd_starts, wd_ends, we_count, we_starts, we_ends):
         if context_key in self.contexts:
             self.contexts[context_key].device_configs[device_name] = {
@@ -117,29 +237,340 @@ class CSVController:
                 'weekday': {'count': wd_count, 'starts': wd_starts, 'ends': wd_ends},
                 'weekend': {'count': we_count, 'starts': we_starts, 'ends': we_ends}
             }
+            self._invalidate_device(context_key, device_name)
+    def set_cycle_overlap(self, policy: str):
+        if policy not in ('mean', 'sum', 'overwrite'): raise CSVServiceError(f"Política de solape desconocida: {policy}")
+        self.CYCLE_OVERLAP = policy
+        self._invalidate_context(self.contexts['ciclos'])
+    def set_ac_parameters(self, peak: int = None, window: int = None, pattern: int = None):
+        peak = self.AC_PEAK_SAMPLES if peak is None else peak
+        window = self.AC_STABLE_WINDOW if window is None else window
+        pattern = self.AC_PATTERN_SAMPLES if pattern is None else pattern
+        if peak < 0 or window < 2 or pattern < 1: raise CSVServiceError("Parámetros de aires inválidos.")
+        self.AC_PEAK_SAMPLES, self.AC_STABLE_WINDOW, self.AC_PATTERN_SAMPLES = peak, window, pattern
+        self._invalidate_context(self.contexts['aires'])
+    def set_nevera_fill(self, mode: str):
+        if mode not in ('clone', 'periodic'): raise CSVServiceError(f"Modo de relleno desconocido: {mode}")
+        self.NEVERA_FILL = mode
+        self._invalidate_context(self.contexts['hora_exacta'])
+    def set_profile_workers(self, workers: Optional[int]):
+        # None = un proceso por núcleo
+        workers = (os.cpu_count() or 1) if workers is None else workers
+        if workers < 0: raise CSVServiceError("Cantidad de procesos inválida.")
+        if workers != self.PROFILE_WORKERS: self.close_profile_pool()
+        self.PROFILE_WORKERS = workers
+    def set_resolution(self, seconds: int):
+        # De 1 s a 60 min; bajo el minuto debe dividir 60 s y sobre él ser minutos exactos que dividan el día
+        if not 1 <= seconds <= 3600 or (60 % seconds and seconds % 60) or 86400 % seconds:
+            raise CSVServiceError(f"Resolución no soportada: {seconds} s")
+        self.RESOLUTION = seconds
+        self._axes.clear()
+        for ctx in self.contexts.values(): self._invalidate_context(ctx)
+    def set_holidays(self, days: Iterable):
+        # date, datetime o 'dd/mm/aaaa'
+        self.HOLIDAYS = {self._as_day(d).astype(object) for d in days}
+    def get_holidays(self) -> List[str]:
+        return [d.strftime("%d/%m/%Y") for d in sorted(self.HOLIDAYS)]
+    def get_slot_energy_factor(self) -> float:
+        # kWh que aporta 1 W sostenido durante una ranura
+        return self.RESOLUTION / 3.6e6
+    def _slots(self) -> int:
+        return 86400 // self.RESOLUTION
     def get_device_config(self, context_key, device_name):
         if context_key in self.contexts: return self.contexts[context_key].device_configs.get(device_name, {})
         return {}
 
+    # --- CACHÉ DE PERFILES ---
+    def _invalidate_device(self, context_key, device_name):
+        cache = self.contexts[context_key].analysis_cache
+        for key in [k for k in cache if k[0] == device_name]: del cache[key]
+        self.generation += 1
+        self._dirty_devices.add((context_key, device_name))
+
+    def _invalidate_context(self, ctx: CSVContext):
+        ctx.analysis_cache.clear()
+        self.generation += 1
+        self._structure_generation = self.generation
+
+    def _config_hash(self, config: Dict) -> int:
+        return hash(json.dumps(config, sort_keys=True, default=str))
+
+    def get_cache_stats(self) -> Dict[str, int]:
+        entries = sum(len(ctx.analysis_cache) for ctx in self.contexts.values())
+        return {'hits': self.cache_stats['hits'], 'misses': self.cache_stats['misses'], 'entries': entries}
+
+    # --- CÁLCULO PARALELO ---
+    def _prefetch_profiles(self, keys: List[Tuple[str, str]]) -> Dict[Tuple[str, Tuple], np.ndarray]:
+        # Calcula en el pool de procesos los perfiles que aún no están en caché; _day_vector los toma
+        # como fallos de caché sin recalcularlos. Un fallo del pool se ignora: se calculan después en serie
+        if self.PROFILE_WORKERS < 2: return {}
+        tasks = []
+        for k, dev in keys:
+            config_hash = self._config_hash(self.get_device_config(k, dev))
+            for day_type in ('weekday', 'weekend'):
+                cache_key = (dev, day_type, config_hash)
+                if cache_key not in self.contexts[k].analysis_cache: tasks.append((k, dev, day_type, cache_key))
+        if not tasks: return {}
+        try:
+            series = {(k, dev): self._get_series(k, dev) for k, dev, _, _ in tasks}
+            # El costo de un perfil es proporcional a las muestras de su serie
+            if sum(len(series[k, dev]) for k, dev, _, _ in tasks) < self.PARALLEL_MIN_SAMPLES: return {}
+            state = self._worker_state(series)
+            chunk = max(1, len(tasks) // (self.PROFILE_WORKERS * 4))
+            results = list(self._profile_pool().map(_profile_worker, [(state, t[:3]) for t in tasks], chunksize=chunk))
+        except Exception:
+            self.close_profile_pool()
+            return {}
+        prefetched = {}
+        for (k, _, _, cache_key), p_vec in zip(tasks, results):
+            if p_vec is not None: prefetched[k, cache_key] = p_vec
+        return prefetched
+
+    def _profile_pool(self) -> ProcessPoolExecutor:
+        # Un solo pool por sesión: los procesos se crean la primera vez y se reutilizan.
+        # El rastreador de memoria compartida debe existir antes de crearlos: si cada proceso
+        # levanta el suyo, al terminar borra el bloque que el controlador todavía usa
+        if self._pool is None:
+            if os.name == 'posix': resource_tracker.ensure_running()
+            self._pool = ProcessPoolExecutor(max_workers=self.PROFILE_WORKERS)
+        return self._pool
+
+    def close_profile_pool(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+        self._release_pool_block()
+
+    def _release_pool_block(self):
+        if self._pool_block is None: return
+        shm = self._pool_block[1]
+        self._pool_block = None
+        shm.close()
+        try: shm.unlink()
+        except FileNotFoundError: pass
+
+    def _shared_series(self, series: Dict[Tuple[str, str], DeviceSeries]) -> Tuple[str, Dict]:
+        # Fechas (int64) y valores (float64) de todas las series en un bloque de memoria compartida;
+        # los procesos lo mapean sin copiarlo. Se reutiliza mientras las series sean las mismas
+        key = tuple((k, dev, id(s)) for (k, dev), s in series.items())
+        if self._pool_block is not None and self._pool_block[0] == key:
+            return self._pool_block[1].name, self._pool_block[2]
+        self._release_pool_block()
+        total = sum(len(s) for s in series.values())
+        shm = shared_memory.SharedMemory(create=True, size=max(1, total * 16))
+        times = np.ndarray(total, dtype=np.int64, buffer=shm.buf)
+        values = np.ndarray(total, dtype=np.float64, buffer=shm.buf, offset=total * 8)
+        layout, pos = {}, 0
+        for (k, dev), s in series.items():
+            n = len(s)
+            times[pos:pos + n] = s.times.astype(np.int64)
+            values[pos:pos + n] = s.values
+            layout[k, dev] = (pos, n, s.nominal, s.failed_rows)
+            pos += n
+        del times, values
+        # Las series se conservan con el bloque para que sus id no se reutilicen
+        self._pool_block = (key, shm, {'total': total, 'series': layout, 'refs': list(series.values())})
+        return shm.name, self._pool_block[2]
+
+    def _worker_state(self, series: Dict[Tuple[str, str], DeviceSeries]) -> Dict:
+        # Lo mínimo para calcular perfiles: configuraciones y parámetros; las series viajan por memoria compartida
+        block_name, block = self._shared_series(series)
+        self._pool_calls += 1
+        contexts = {}
+        for k in {k for k, _ in series}:
+            ctx = self.contexts[k]
+            contexts[k] = {
+                'columns': ctx.data.columns, 'device_columns': ctx.device_columns, 'device_index': ctx.device_index,
+                'device_configs': ctx.device_configs, 'device_meta': ctx.device_meta,
+                'series': {dev: spec for (kk, dev), spec in block['series'].items() if kk == k}
+            }
+        return {'call': (os.getpid(), self._pool_calls), 'block': block_name, 'total': block['total'], 'contexts': contexts,
+                'params': {name: v for name, v in self.__dict__.items() if name.isupper()}}
+
     # --- LECTURA ---
-    def load_csv(self, path: str, context_key: str):
+    def load_csv(self, path: str, context_key: str, append: bool = False, aggregate: bool = None):
+        # aggregate: ingesta agregada por minuto (por defecto AGGREGATE_INGEST); las filas no se conservan
         if context_key not in self.contexts: self.contexts[context_key] = CSVContext()
         ctx = self.contexts[context_key]
+        if append and self._can_append(ctx, path): return self._append_tail(ctx, context_key, path)
+        aggregate = self.AGGREGATE_INGEST if aggregate is None else aggregate
+        # La carga se arma sobre un contexto nuevo: si falla, el anterior queda intacto
+        new = CSVContext()
+        stream = None
+        try:
+            cache_key = self.file_cache.key_for(path) if self.file_cache and not aggregate else None
+            data = self.file_cache.load(cache_key) if cache_key else None
+            from_cache = data is not None
+            if not from_cache:
+                if aggregate:
+                    data, stream = CSVService.open_stream(path)
+                elif CSVService.should_map(path):
+                    data = CSVService.read_csv_mapped(path)
+                else:
+                    data, chunks = CSVService.open_stream(path)
+                    for chunk in chunks: data.rows.extend(chunk)
+            new.data = data
+        except CSVServiceError: raise
+        except Exception as e: raise CSVServiceError(f"Error inesperado al leer CSV: {e}")
+        if not new.data.columns: raise CSVServiceError("CSV sin encabezados.")
+        if len(new.data.columns) < 1: raise CSVServiceError("El CSV está vacío.")
+        self._parse_device_pairs(new, context_key)
+        if not new.device_columns: raise CSVServiceError("No se encontraron dispositivos válidos.")
         try:
-            ctx.data = CSVService.read_csv(path)
-            ctx.analysis_cache.clear()
-            ctx.device_configs.clear()
-            ctx.device_meta.clear()
+            if stream is not None:
+                self._sample_date_formats(new, path)
+                new.source_rows = self._aggregate_rows(new, stream)
+            elif not from_cache:
+                indices = self._build_columnar(new)
+                if cache_key: self.file_cache.save(cache_key, new.data, indices)
+            self._build_series(new, context_key)
         except CSVServiceError: raise
         except Exception as e: raise CSVServiceError(f"Error inesperado al leer CSV: {e}")
-        if not ctx.data.columns: raise CSVServiceError("CSV sin encabezados.")
-        if len(ctx.data.columns) < 1: raise CSVServiceError("El CSV está vacío.")
-        self._parse_device_pairs(ctx, context_key)
-        if not ctx.device_columns: raise CSVServiceError("No se encontraron dispositivos válidos.")
+        new.source_path = path
+        if stream is None: new.source_rows = self._row_count(new)
+        # Mismo objeto de contexto (otras vistas lo referencian); configuraciones y perfiles se reinician
+        ctx.__dict__.update(new.__dict__)
+        self._invalidate_context(ctx)
         return ctx.data
 
+    def reload_append(self, context_key: str):
+        ctx = self.contexts.get(context_key)
+        if not ctx or not ctx.data or not ctx.source_path:
+            raise CSVServiceError(f"No hay datos cargados en {context_key}.")
+        return self.load_csv(ctx.source_path, context_key, append=True)
+
+    def _can_append(self, ctx: CSVContext, path: str) -> bool:
+        # Solo si es el mismo archivo y creció (si se truncó o rotó, se recarga completo)
+        if not ctx.data or ctx.source_path != path or not ctx.data.source_bytes: return False
+        # Una fila sin terminar ya sumada a los agregados por minuto no se puede quitar: se recarga todo
+        if ctx.aggregates and ctx.data.partial_row is not None: return False
+        try: return os.path.getsize(path) >= ctx.data.source_bytes
+        except OSError: return False
+
+    def _append_tail(self, ctx: CSVContext, context_key: str, path: str):
+        # Modo anexar: se parsea solo la cola nueva y se conservan configuraciones y metadatos
+        try:
+            new_rows, offset, partial_row = CSVService.read_tail(path, ctx.data)
+            if new_rows:
+                if ctx.data.partial_row is not None:
+                    # La fila leída sin terminar vuelve a venir completa (o más larga): se reemplaza
+                    CSVService.drop_last_row(ctx.data)
+                    ctx.source_rows -= 1
+                if ctx.aggregates: self._aggregate_rows(ctx, [new_rows])
+                else:
+                    ctx.data.append_rows(new_rows)
+                    CSVService.extend_columnar(ctx.data, new_rows)
+                self._build_series(ctx, context_key)
+                self._invalidate_context(ctx)
+            ctx.data.source_bytes = offset
+            ctx.data.partial_row = partial_row
+        except CSVServiceError: raise
+        except Exception as e: raise CSVServiceError(f"Error inesperado al leer CSV: {e}")
+        ctx.source_rows += len(new_rows)
+        return ctx.data
+
+    def _row_count(self, ctx: CSVContext) -> int:
+        return max((len(arr) for arr in ctx.data.numeric.values()), default=0)
+
+    def _aggregate_rows(self, ctx: CSVContext, chunks: Iterable[List[List[str]]]) -> int:
+        # Recorre las filas por bloques: de cada bloque solo queda su agregado por minuto,
+        # combinado con lo ya agregado (memoria proporcional a los minutos, no a las muestras)
+        parts = {dev: [ctx.aggregates[dev]] if dev in ctx.aggregates else [] for dev in ctx.device_columns}
+        rows = 0
+        for chunk in chunks:
+            rows += len(chunk)
+            for dev in ctx.device_columns:
+                fecha_idx, val_idx = self._device_indices(ctx, dev)
+                values = CSVService.parse_numeric([r[val_idx] for r in chunk])
+                times, failed = None, 0
+                if fecha_idx is not None:
+                    stamps = [r[fecha_idx] for r in chunk]
+                    date_fmt = ctx.data.date_formats.get(fecha_idx)
+                    # Sin muestra previa (archivo sin filas completas al cargar): se detecta sobre el bloque
+                    if date_fmt is None: date_fmt = ctx.data.date_formats[fecha_idx] = self._detect_date_format(stamps)
+                    times, failed = CSVService.parse_timestamps(stamps, date_fmt)
+                parts[dev].append(MinuteAggregate.from_samples(times, values, failed))
+                if len(parts[dev]) >= self.AGGREGATE_MERGE_PARTS: parts[dev] = [MinuteAggregate.combine(parts[dev])]
+        ctx.aggregates = {dev: MinuteAggregate.combine(p) for dev, p in parts.items()}
+        return rows
+
+    def _sample_date_formats(self, ctx: CSVContext, path: str):
+        # Las filas del modo agregado se descartan bloque a bloque: el formato de cada columna de fechas
+        # se decide antes, sobre una muestra acotada repartida por todo el archivo (no solo el primer bloque)
+        sample = CSVService.sample_rows(path, ctx.data, self.DATE_SAMPLE_ROWS)
+        if not sample: return
+        for fecha_idx, _ in (self._device_indices(ctx, dev) for dev in ctx.device_columns):
+            if fecha_idx is not None and fecha_idx not in ctx.data.date_formats:
+                ctx.data.date_formats[fecha_idx] = self._detect_date_format([r[fecha_idx] for r in sample])
+
+    def get_minute_aggregate(self, context_key: str, device_name: str) -> Optional[MinuteAggregate]:
+        # Promedio / mínimo / máximo / conteo por minuto (solo contextos cargados en modo agregado)
+        ctx = self.contexts.get(context_key)
+        return ctx.aggregates.get(device_name) if ctx else None
+
+    def _build_columnar(self, ctx: CSVContext) -> List[int]:
+        # Columnas tipadas de cada dispositivo (se parsean una sola vez, aquí en la carga)
+        pairs = [self._device_indices(ctx, device_name) for device_name in ctx.device_columns]
+        indices = [i for pair in pairs for i in pair if i is not None]
+        # Todas las columnas de texto en una sola pasada (MappedCSVData recorre el archivo por cada select)
+        ctx.data.select(indices)
+        for fecha_idx, val_idx in pairs: self._typed_columns(ctx, fecha_idx, val_idx)
+        return indices
+
+    def _device_indices(self, ctx: CSVContext, device_name: str) -> Tuple[Optional[int], int]:
+        if device_name in ctx.device_index: return ctx.device_index[device_name]
+        # Proyectos guardados con versiones anteriores: posición por nombre de columna
+        fecha_col, val_col = ctx.device_columns[device_name]
+        try: return (ctx.data.columns.index(fecha_col) if fecha_col else None), ctx.data.columns.index(val_col)
+        except ValueError: raise CSVServiceError("Error de índices.")
+
+    def _build_series(self, ctx: CSVContext, context_key: str):
+        # Índice por dispositivo: fechas y valores parseados y ordenados una sola vez por carga
+        ctx.series = {dev: self._device_series(ctx, dev, context_key) for dev in ctx.device_columns}
+
+    def _get_series(self, context_key: str, device_name: str) -> DeviceSeries:
+        # Proyectos guardados sin el índice lo construyen la primera vez que se pide
+        ctx = self.contexts[context_key]
+        if device_name not in ctx.series: ctx.series[device_name] = self._device_series(ctx, device_name, context_key)
+        return ctx.series[device_name]
+
+    def _device_series(self, ctx: CSVContext, device_name: str, context_key: str) -> DeviceSeries:
+        if device_name in ctx.aggregates:
+            # Una muestra por minuto (su promedio; la nevera se queda con la última muestra del minuto,
+            # como con las filas crudas); sin texto original, la tabla se arma desde los valores
+            agg = ctx.aggregates[device_name]
+            nominal = float(agg.peak) if agg.peak > 0 else 0.0
+            values = agg.lasts if self._is_nevera(context_key, device_name) else agg.means()
+            return DeviceSeries(agg.minutes.astype('datetime64[s]'), values, nominal=nominal, failed_rows=agg.failed_rows)
+        fecha_idx, val_idx = self._device_indices(ctx, device_name)
+        times, values = self._typed_columns(ctx, fecha_idx, val_idx)
+        if times is None:
+            nominal_idx = self._nominal_row(values, np.arange(len(values)))
+            return DeviceSeries(nominal=float(values[nominal_idx]) if nominal_idx is not None else 0.0)
+        f_strs, v_strs = ctx.data.select([fecha_idx, val_idx])
+        # Solo filas con fecha válida, ordenadas por fecha (estable: respeta el orden del archivo)
+        valid_idx = np.flatnonzero(~np.isnat(times))
+        order = valid_idx[np.argsort(times[valid_idx], kind='stable')]
+        nominal_idx = self._nominal_row(values, valid_idx)
+        rows = order.tolist()
+        failed = ctx.data.timestamp_failures.get((fecha_idx, ctx.data.date_formats[fecha_idx]), 0)
+        return DeviceSeries(times[order], values[order], [f_strs[i] for i in rows], [v_strs[i] for i in rows],
+                            float(values[nominal_idx]) if nominal_idx is not None else 0.0, failed)
+
+    def _typed_columns(self, ctx: CSVContext, fecha_idx: Optional[int], val_idx: int) -> Tuple[Optional[np.ndarray], np.ndarray]:
+        if fecha_idx is not None and val_idx not in ctx.data.numeric:
+            # Ambas columnas del par en una sola pasada (relevante para MappedCSVData)
+            ctx.data.select([fecha_idx, val_idx])
+        values = CSVService.numeric_column(ctx.data, val_idx)
+        if fecha_idx is None: return None, values
+        date_fmt = ctx.data.date_formats.get(fecha_idx)
+        if date_fmt is None:
+            date_fmt = ctx.data.date_formats[fecha_idx] = self._detect_date_format(ctx.data.column(fecha_idx))
+        return CSVService.timestamp_column(ctx.data, fecha_idx, date_fmt), values
+
     def _parse_device_pairs(self, ctx: CSVContext, context_key: str):
         ctx.device_columns = {}
+        ctx.device_index = {}
         cols = [col.strip() for col in ctx.data.columns]
         i = 0
         pairs_found = False
@@ -159,11 +590,12 @@ class CSVController:
                         suffix += 1
                         device_name = f"{original}_{suffix}"
                     ctx.device_columns[device_name] = (fecha_col, value_col)
+                    ctx.device_index[device_name] = (i, i + 1)
                     if meta: ctx.device_meta[device_name] = meta
                     pairs_found = True
             i += 2
         if context_key == 'escalones' and not pairs_found:
-            for col in cols:
+            for j, col in enumerate(cols):
                 if not col: continue
                 device_name = col.strip()
                 original = device_name
@@ -172,6 +604,7 @@ class CSVController:
                     suffix += 1
                     device_name = f"{original}_{suffix}"
                 ctx.device_columns[device_name] = (None, col)
+                ctx.device_index[device_name] = (None, j)
 
     def _extract_device_info(self, col_name: str) -> Tuple[str, Optional[Dict]]:
         clean_name = col_name
@@ -190,15 +623,17 @@ class CSVController:
         n, _ = self._extract_device_info(date_column)
         return n
 
-    def _detect_date_format(self, rows, col_idx):
-        if not rows: return "%d/%m/%Y %H:%M:%S"
+    def _detect_date_format(self, values: List[str]):
+        if not values: return "%d/%m/%Y %H:%M:%S"
         sep = '/'
-        for row in rows[:10]:
-            if col_idx < len(row) and row[col_idx].strip() and '-' in row[col_idx]: sep = '-'; break
+        for v in values[:10]:
+            if v.strip() and '-' in v: sep = '-'; break
         p1_values, p2_values = set(), set()
-        for row in rows:
-            if col_idx >= len(row): continue
-            val = row[col_idx].strip().split(' ')[0]
+        # Se corta en cuanto un campo > 12 lo define; si no, decide una muestra
+        # acotada repartida sobre toda la columna (cubre todo el rango de fechas)
+        step = max(1, len(values) // self.DATE_SAMPLE_ROWS)
+        for v in values[::step]:
+            val = v.strip().split(' ')[0]
             if not val: continue
             parts = val.split(sep)
             if len(parts) >= 2:
@@ -212,18 +647,18 @@ class CSVController:
         if len(p1_values) >= len(p2_values): return f"%d{sep}%m{sep}%Y %H:%M:%S"
         return f"%m{sep}%d{sep}%Y %H:%M:%S"
 
+    def get_date_format(self, context_key: str, device_name: str) -> Optional[str]:
+        # Formato detectado en la carga (se guarda por columna hasta la próxima recarga)
+        ctx = self.contexts.get(context_key)
+        if not ctx or not ctx.data or device_name not in ctx.device_columns: return None
+        fecha_idx, _ = self._device_indices(ctx, device_name)
+        if fecha_idx is None: return None
+        return ctx.data.date_formats.get(fecha_idx)
+
     def get_devices(self, context_key: str):
         if context_key in self.contexts: return list(self.contexts[context_key].device_columns.keys())
         return []
 
-    def _parse_date(self, date_str: str) -> Optional[datetime]:
-        if not date_str: return None
-        formats = ["%m/%d/%Y %H:%M:%S", "%m/%d/%Y %H:%M", "%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d"]
-        for fmt in formats:
-            try: return datetime.strptime(date_str.strip(), fmt)
-            except ValueError: continue
-        return None
-
     # --- TABLA DUAL ---
     def get_dual_table_data(self, context_key: str, device_name: str) -> List[Tuple[str, str, str]]:
         if context_key == 'hora_exacta':
@@ -255,210 +690,212 @@ class CSVController:
 
     # --- OBTENCIÓN DE DATOS ---
     def get_values_for_device(self, context_key: str, device_name: str, start_times: List[str] = None, end_times: List[str] = None) -> List[Tuple[str, str]]:
+        # Frontera con la tabla: único punto donde el perfil tipado se convierte a texto
+        return self._format_profile(self.get_device_profile(context_key, device_name, start_times, end_times))
+
+    def get_device_profile(self, context_key: str, device_name: str, start_times: List[str] = None, end_times: List[str] = None) -> DayProfile:
         self.last_warning = None
         if context_key not in self.contexts or not self.contexts[context_key].data:
             raise CSVServiceError(f"No hay datos cargados en {context_key}.")
         ctx = self.contexts[context_key]
         if device_name not in ctx.device_columns: raise CSVServiceError(f"Dispositivo '{device_name}' no encontrado.")
-        fecha_col, val_col = ctx.device_columns[device_name]
-        raw_data = []
-        nominal_power_str = "0"
-        max_val_found = 0.0
-        if fecha_col:
-            try:
-                fecha_idx = ctx.data.columns.index(fecha_col)
-                val_idx = ctx.data.columns.index(val_col)
-            except ValueError: raise CSVServiceError("Error de índices.")
-            date_fmt = self._detect_date_format(ctx.data.rows, fecha_idx)
-            for row in ctx.data.rows:
-                f_str = row[fecha_idx] if fecha_idx < len(row) else ""
-                v_str = row[val_idx] if val_idx < len(row) else ""
-                try: dt = datetime.strptime(f_str.strip(), date_fmt)
-                except:
-                    try: dt = datetime.strptime(f_str.strip(), date_fmt.replace(":%S", ""))
-                    except: continue
-                raw_data.append((dt, f_str, v_str))
-                try:
-                    val = float(v_str.replace(',', '.'))
-                    if val > max_val_found:
-                        max_val_found = val
-                        nominal_power_str = v_str
-                except: continue
-            raw_data.sort(key=lambda x: x[0])
-        else:
-            try: val_idx = ctx.data.columns.index(val_col)
-            except ValueError: raise CSVServiceError("Error de índices.")
-            for row in ctx.data.rows:
-                if val_idx < len(row):
-                    v_str = row[val_idx]
-                    try:
-                        val = float(v_str.replace(',', '.'))
-                        if val > max_val_found:
-                            max_val_found = val
-                            nominal_power_str = v_str
-                    except: continue
+        series = self._get_series(context_key, device_name)
+        if series.failed_rows:
+            self.last_warning = f"⚠️ Se omitieron {series.failed_rows} filas con fecha inválida."
 
-        dev_lower = device_name.lower()
-        
-        if context_key == 'hora_exacta' and ("nevera" in dev_lower or "neve" in dev_lower):
-            return self._process_nevera_logic(raw_data)
+        if self._is_nevera(context_key, device_name):
+            return self._process_nevera_logic(series)
         elif context_key == 'ciclos' and start_times is not None:
-            return [(item[1], item[2]) for item in self._apply_multi_cycle_day(raw_data, start_times)]
+            return self._apply_multi_cycle_day(series, start_times)
         elif context_key == 'escalones' and start_times is not None and end_times is not None:
-            if raw_data: base_date = raw_data[0][0].date()
-            else: base_date = datetime.now().date()
-            step_data = self._generate_step_profile(nominal_power_str, base_date, start_times, end_times)
-            return [(item[1], item[2]) for item in step_data]
+            base_date = series.start_date() or datetime.now().date()
+            return self._generate_step_profile(series.nominal, base_date, start_times, end_times)
             
         # --- AIRES ACONDICIONADOS (NUEVA LÓGICA) ---
         elif context_key == 'aires' and start_times is not None and end_times is not None:
-            if raw_data: base_date = raw_data[0][0].date()
-            else: base_date = datetime.now().date()
-            ac_data = self._generate_ac_profile(raw_data, base_date, start_times, end_times)
-            return [(item[1], item[2]) for item in ac_data]
+            base_date = series.start_date() or datetime.now().date()
+            return self._generate_ac_profile(series, base_date, start_times, end_times)
             
         else:
-            return [(item[1], item[2]) for item in raw_data]
+            return self._raw_profile(series)
+
+    def _is_nevera(self, context_key: str, device_name: str) -> bool:
+        dev_lower = device_name.lower()
+        return context_key == 'hora_exacta' and ("nevera" in dev_lower or "neve" in dev_lower)
+
+    def get_gap_report(self, context_key: str, device_name: str) -> Optional[Dict]:
+        # Resumen del relleno de huecos (solo perfiles reconstruidos, ej: nevera)
+        return self.get_device_profile(context_key, device_name).gaps
+
+    def _raw_profile(self, series: DeviceSeries) -> DayProfile:
+        # La serie tal cual, anclada a la medianoche de su primera muestra
+        if not len(series): return DayProfile(datetime.now().date())
+        base = series.times[0].astype('datetime64[D]')
+        offsets = (series.times - base).astype(np.int64)
+        texts = (series.time_strs, series.value_strs) if series.time_strs else None
+        return DayProfile(base, offsets, series.values, texts, valid=series.valid)
+
+    def _format_profile(self, profile: DayProfile) -> List[Tuple[str, str]]:
+        if profile.texts is not None: return list(zip(*profile.texts))
+        stamps = (profile.base.astype('datetime64[s]') + profile.offsets).astype(object)
+        return [(t.strftime(self.PROFILE_DATE_FORMAT), self._format_value(v)) for t, v in zip(stamps, profile.values.tolist())]
+
+    def _format_value(self, v: float) -> str:
+        # Coma decimal y sin ",0" en enteros, como en los archivos de origen; a 4 decimales
+        # (los promedios del modo agregado o de ciclos superpuestos no son valores del archivo)
+        if v != v: return ""
+        v = round(v, 4)
+        if v.is_integer(): return str(int(v))
+        return repr(v).replace('.', ',')
+
+    def _nominal_row(self, values: np.ndarray, candidates: np.ndarray) -> Optional[int]:
+        # Fila del primer valor máximo (> 0) entre los candidatos, en orden de archivo
+        if not len(candidates): return None
+        cand = values[candidates]
+        if not np.any(cand > 0): return None
+        return int(candidates[np.nanargmax(cand)])
 
     # ========================================================
-    #  LÓGICA AIRES: 100 + ESTABILIDAD + 60 (V44)
+    #  LÓGICA AIRES: PICO + ESTABILIDAD + PATRÓN
+    #  (por defecto 100 + ventana de 10 + 60 muestras)
     # ========================================================
-    def _generate_ac_profile(self, raw_data, base_date, start_times, end_times):
-        if not raw_data: return []
+    def _generate_ac_profile(self, series: DeviceSeries, base_date, start_times, end_times) -> DayProfile:
+        if not len(series): return DayProfile(base_date)
         
-        # 1. Extraer numéricos
-        numeric_vals = []
-        for _, _, v in raw_data:
-            try: numeric_vals.append(float(v.replace(',', '.')))
-            except: continue
+        # 1. Extraer numéricos (ya parseados en el índice)
+        numeric_vals = series.values[series.valid]
         
-        if not numeric_vals: return []
+        if not len(numeric_vals): return DayProfile(base_date)
 
-        # 2. Fase 1: Pico (Primeros 100)
-        peak_vals = numeric_vals[:100]
-        
-        # 3. Fase 2: Patrón (Siguientes 60 tras buscar estabilidad)
-        # Simplificamos la búsqueda: tomamos directamente el bloque después del pico si existe
-        remaining = numeric_vals[100:]
-        pattern_vals = []
+        # 2. Fase 1: Pico (primeras AC_PEAK_SAMPLES muestras)
+        peak_vals = numeric_vals[:self.AC_PEAK_SAMPLES]
         
-        if remaining:
-            # Buscamos en los primeros 50 del restante el punto más estable (menor desviación)
-            # O si es muy corto, tomamos lo que hay
-            best_idx = 0
-            if len(remaining) > 10:
-                min_std = float('inf')
-                scan_limit = min(len(remaining), 50)
-                for i in range(scan_limit - 10):
-                    chunk = remaining[i : i+10]
-                    std = statistics.stdev(chunk)
-                    if std < min_std:
-                        min_std = std
-                        best_idx = i
-            
-            pattern_vals = remaining[best_idx : best_idx + 60]
+        # 3. Fase 2: Patrón (AC_PATTERN_SAMPLES muestras desde la ventana más estable tras el pico)
+        remaining = numeric_vals[self.AC_PEAK_SAMPLES:]
+        pattern_vals = remaining[:0]
+        if len(remaining):
+            best_idx = self._most_stable_window(remaining, self.AC_STABLE_WINDOW, self.AC_PATTERN_SAMPLES)
+            pattern_vals = remaining[best_idx : best_idx + self.AC_PATTERN_SAMPLES]
         
         # Fallbacks por si la data es muy corta
-        if not peak_vals: peak_vals = [0.0]
-        if not pattern_vals: pattern_vals = [peak_vals[-1]]
-        
-        peak_strs = [str(v).replace('.', ',') for v in peak_vals]
-        pattern_strs = [str(v).replace('.', ',') for v in pattern_vals]
-
-        # 4. Construir Timeline
-        timeline = []
-        current = datetime.combine(base_date, time(0,0))
-        end_of_day = current + timedelta(hours=24)
+        if not len(peak_vals): peak_vals = np.zeros(1)
+        if not len(pattern_vals): pattern_vals = peak_vals[-1:]
         
-        while current < end_of_day:
-            timeline.append({'dt': current, 'str': current.strftime("%d/%m/%Y %H:%M:%S"), 'val': "0"})
-            current += timedelta(minutes=1)
-            
-        if not start_times: return [(t['dt'], t['str'], t['val']) for t in timeline]
+        # 4. Construir Timeline (un valor por minuto del día)
+        timeline = np.zeros(1440)
+        if not start_times: return DayProfile.minute_grid(base_date, timeline)
 
         for i in range(len(start_times)):
             if i >= len(end_times): break
             try:
                 t_s = datetime.strptime(start_times[i], "%H:%M").time()
                 t_e = datetime.strptime(end_times[i], "%H:%M").time()
-                dt_s = datetime.combine(base_date, t_s)
-                dt_e = datetime.combine(base_date, t_e)
-                
-                # Índices
-                base_dt = datetime.combine(base_date, time(0,0))
-                start_idx = int((dt_s - base_dt).total_seconds() // 60)
-                end_idx = int((dt_e - base_dt).total_seconds() // 60)
-                
-                indices_to_fill = []
-                if dt_e < dt_s: # Wrap
-                    indices_to_fill.extend(range(start_idx, 1440))
-                    indices_to_fill.extend(range(0, end_idx))
-                else:
-                    indices_to_fill.extend(range(start_idx, end_idx))
-                
-                # Llenado: Pico -> Pattern Loop
-                for step, idx in enumerate(indices_to_fill):
-                    if idx >= 1440: continue
-                    
-                    if step < len(peak_strs):
-                        timeline[idx]['val'] = peak_strs[step]
-                    else:
-                        pat_idx = (step - len(peak_strs)) % len(pattern_strs)
-                        timeline[idx]['val'] = pattern_strs[pat_idx]
-                        
             except: continue
+            start_idx = t_s.hour * 60 + t_s.minute
+            end_idx = t_e.hour * 60 + t_e.minute
+            if end_idx < start_idx: # Wrap
+                indices_to_fill = np.r_[start_idx:1440, 0:end_idx]
+            else:
+                indices_to_fill = np.arange(start_idx, end_idx)
+            
+            # Llenado: Pico -> Pattern Loop (cada intervalo arranca desde el pico)
+            n = len(indices_to_fill)
+            fill = np.concatenate((peak_vals[:n], np.resize(pattern_vals, max(0, n - len(peak_vals)))))
+            timeline[indices_to_fill] = fill
             
-        return [(t['dt'], t['str'], t['val']) for t in timeline]
+        return DayProfile.minute_grid(base_date, timeline)
+
+    def _most_stable_window(self, values: np.ndarray, window: int, span: int) -> int:
+        # Inicio de la ventana de menor varianza, por varianza móvil O(n) (sumas acumuladas).
+        # Se prefieren inicios desde los que cabe el patrón completo.
+        n = len(values)
+        if n <= window: return 0
+        last = n - max(window, span)
+        if last < 0: last = n - window
+        x = values - values.mean()
+        c1 = np.concatenate(([0.0], np.cumsum(x)))
+        c2 = np.concatenate(([0.0], np.cumsum(x * x)))
+        s1 = c1[window:window + last + 1] - c1[:last + 1]
+        s2 = c2[window:window + last + 1] - c2[:last + 1]
+        var = np.maximum((s2 - s1 * s1 / window) / (window - 1), 0.0)
+        # Empates (ej: tramos constantes): gana la primera ventana, con tolerancia al redondeo de las sumas
+        tol = 1e-12 * max(1.0, float(var.max()))
+        return int(np.flatnonzero(var <= var.min() + tol)[0])
 
     # --- LÓGICA NEVERA ---
-    def _process_nevera_logic(self, sorted_data):
-        if not sorted_data: return []
-        start_dt = sorted_data[0][0]
-        target_day_date = (start_dt + timedelta(days=1)).date()
-        mapped_data = []
-        for dt, _, v_str in sorted_data:
-            current_date = dt.date()
-            new_dt = None
-            if current_date == target_day_date: new_dt = dt
-            elif current_date == start_dt.date():
-                shifted = dt + timedelta(days=1)
-                if shifted.date() == target_day_date: new_dt = shifted
-            if new_dt: mapped_data.append((new_dt, v_str))
-        if not mapped_data: return [(item[1], item[2]) for item in sorted_data]
-        mapped_data.sort(key=lambda x: x[0])
-        day_start = datetime.combine(target_day_date, time(0,0,0))
-        day_end = datetime.combine(target_day_date, time(23,59,0))
-        data_map = {}
-        valid_values = []
-        for dt, val in mapped_data:
-            minute_key = dt.replace(second=0, microsecond=0)
-            data_map[minute_key] = val
-            valid_values.append(val)
-        final_rows = []
-        current = day_start
-        missing_minutes = 0
-        while current <= day_end:
-            if current in data_map:
-                final_rows.append((current, current.strftime("%d/%m/%Y %H:%M:%S"), data_map[current]))
-            else:
-                missing_minutes += 1
-                fill_val = "0"
-                if valid_values:
-                    minute_of_day = (current - day_start).seconds // 60
-                    clone_idx = minute_of_day % len(valid_values)
-                    fill_val = valid_values[clone_idx]
-                final_rows.append((current, current.strftime("%d/%m/%Y %H:%M:%S"), fill_val))
-            current += timedelta(minutes=1)
-        if missing_minutes > 60:
-            hours_missing = missing_minutes / 60
+    def _process_nevera_logic(self, series: DeviceSeries) -> DayProfile:
+        if not len(series): return DayProfile(datetime.now().date())
+        days = series.times.astype('datetime64[D]')
+        first_day = days[0]
+        target_day = first_day + 1
+        # El día 1 se corre un día hacia adelante y se superpone al día 2
+        keep = (days == first_day) | (days == target_day)
+        mapped = series.times[keep] + np.where(days[keep] == first_day, 86400, 0)
+        offsets = (mapped - target_day).astype(np.int64)
+        order = np.argsort(offsets, kind='stable')
+        minutes = offsets[order] // 60
+        valid_values = series.values[keep][order]
+
+        # Por minuto se queda la última muestra
+        final_vals = np.full(1440, np.nan)
+        present = np.zeros(1440, dtype=bool)
+        uniq, rev_idx = np.unique(minutes[::-1], return_index=True)
+        final_vals[uniq] = valid_values[len(minutes) - 1 - rev_idx]
+        present[uniq] = True
+        missing = np.flatnonzero(~present)
+
+        # Huecos (NEVERA_FILL):
+        #   'clone'    -> valor de la muestra (minuto % cantidad de muestras), patrón histórico
+        #   'periodic' -> mismo punto del ciclo del compresor (minuto ± k·período); lo que
+        #                 no se alcanza, o si no se detecta un ciclo claro, se clona
+        gaps = {'missing_minutes': len(missing), 'method': 'clone', 'period_minutes': None}
+        if self.NEVERA_FILL == 'periodic' and len(missing):
+            known = present & ~np.isnan(final_vals)
+            period = self._detect_compressor_period(final_vals, known)
+            if period:
+                gaps['method'], gaps['period_minutes'] = 'periodic', period
+                source = final_vals.copy()
+                for k in range(1, 1440 // period + 1):
+                    for shift in (k * period, -k * period):
+                        if not len(missing): break
+                        src = (missing - shift) % 1440
+                        hit = known[src]
+                        final_vals[missing[hit]] = source[src[hit]]
+                        missing = missing[~hit]
+        final_vals[missing] = valid_values[missing % len(valid_values)]
+
+        if gaps['missing_minutes'] > 60:
+            hours_missing = gaps['missing_minutes'] / 60
             self.last_warning = f"⚠️ Datos Incompletos: Faltaban {hours_missing:.1f} horas. Se completó con patrones."
-        return [(r[1], r[2]) for r in final_rows]
+        return DayProfile.minute_grid(target_day, final_vals, gaps)
+
+    def _detect_compressor_period(self, values: np.ndarray, known: np.ndarray) -> Optional[int]:
+        # Autocorrelación circular del día (solo pares de minutos con dato). El período es el
+        # primer pico después del primer cruce por cero; None si no hay un ciclo claro.
+        if known.sum() < 120: return None
+        x = np.where(known, values - values[known].mean(), 0.0)
+        var = float((x[known] ** 2).mean())
+        if var <= 0: return None
+        max_lag = min(self.NEVERA_MAX_PERIOD, 720)
+        corr = np.full(max_lag + 1, np.nan)
+        for lag in range(1, max_lag + 1):
+            both = known & np.roll(known, -lag)
+            if both.sum() >= 60: corr[lag] = (x * np.roll(x, -lag))[both].mean() / var
+        below = np.flatnonzero(corr < 0)
+        if not len(below): return None
+        tail = np.nan_to_num(corr[below[0]:], nan=-np.inf)
+        best = tail.max()
+        if best < 0.3: return None
+        # Primer tramo cercano al máximo (evita elegir un múltiplo del período)
+        near = tail >= 0.9 * best
+        start = int(np.flatnonzero(near)[0])
+        end = start + (int(np.flatnonzero(~near[start:])[0]) if not near[start:].all() else len(near) - start)
+        return int(below[0] + start + np.argmax(tail[start:end]))
 
     # --- VECTORES ---
-    def get_daily_power_vector(self, context_key: str, device_name: str, starts=None, ends=None) -> List[float]:
-        data_rows = self.get_values_for_device(context_key, device_name, starts, ends)
-        if not data_rows: return [0.0] * 1440
-        power_axis = [0.0] * 1440
+    def get_daily_power_vector(self, context_key: str, device_name: str, starts=None, ends=None) -> np.ndarray:
+        profile = self.get_device_profile(context_key, device_name, starts, ends)
+        if not len(profile): return np.zeros(self._slots())
         ctx = self.contexts.get(context_key)
         meta = ctx.device_meta.get(device_name, {})
         conversion_factor = self.VOLTAGE
@@ -467,195 +904,234 @@ class CSVController:
             q = meta.get('quantity', 1)
             v = meta.get('voltage', 120.0)
             conversion_factor = q * v
-        try:
-            sample_date = data_rows[0][0]
-            fmt = "%d/%m/%Y %H:%M:%S"
-            if '/' in sample_date:
-                parts = sample_date.split(' ')[0].split('/')
-                if int(parts[0]) > 12: fmt = "%d/%m/%Y %H:%M:%S"
-                elif int(parts[1]) > 12: fmt = "%m/%d/%Y %H:%M:%S"
-            first_dt = datetime.strptime(sample_date, fmt)
-            start_of_day = datetime.combine(first_dt.date(), time(0,0))
-        except: 
-            start_of_day = datetime.combine(datetime.now().date(), time(0,0))
-            fmt = "%d/%m/%Y %H:%M:%S"
-        minute_buckets = {i: [] for i in range(1440)}
-        for t_str, v_str in data_rows:
-            try: dt = datetime.strptime(t_str, fmt)
-            except:
-                try: dt = datetime.strptime(t_str, "%m/%d/%Y %H:%M:%S")
-                except: continue
-            minute_idx = int((dt - start_of_day).total_seconds() // 60) % 1440
-            try:
-                val = float(v_str.replace(',', '.'))
-                minute_buckets[minute_idx].append(val)
-            except: continue
-        for i in range(1440):
-            values = minute_buckets[i]
-            if values:
-                avg = sum(values) / len(values)
-                power_axis[i] = avg * conversion_factor
-        return power_axis
-
-    def get_typical_day_profile(self, context_key: str, device_name: str, day_type: str) -> Tuple[List[datetime], List[float]]:
+        # Promedio por minuto del día; las demás resoluciones se derivan de él (agrupando o
+        # repitiendo minutos), así la energía del día no depende de la resolución elegida
+        res = self.RESOLUTION
+        power_axis, _ = self._slot_means(profile, 60)
+        if res > 60: power_axis = power_axis.reshape(-1, res // 60).mean(axis=1)
+        elif res < 60:
+            per_minute = 60 // res
+            minute = power_axis
+            power_axis = np.repeat(minute, per_minute)
+            if not profile.hold:
+                # Muestras puntuales: las ranuras con datos propios los usan y el resto toma el promedio de
+                # su minuto; luego cada minuto se reescala para que sus ranuras promedien lo mismo que él
+                fine, counts = self._slot_means(profile, res)
+                fine = np.where(counts > 0, fine, power_axis).reshape(-1, per_minute)
+                fine_mean = fine.mean(axis=1)
+                scale = np.divide(minute, fine_mean, out=np.zeros_like(minute), where=fine_mean != 0)
+                fine = np.where((fine_mean != 0)[:, None], fine * scale[:, None], minute[:, None])
+                power_axis = fine.ravel()
+        return power_axis * conversion_factor
+
+    def _slot_means(self, profile: DayProfile, seconds: int) -> Tuple[np.ndarray, np.ndarray]:
+        # Sumas y conteos por ranura en una sola pasada; las ranuras sin muestras quedan en 0
+        slots = 86400 // seconds
+        valid = profile.valid
+        slot_idx = profile.slot_of_day(seconds)[valid]
+        sums = np.bincount(slot_idx, weights=profile.values[valid], minlength=slots)
+        counts = np.bincount(slot_idx, minlength=slots)
+        return np.divide(sums, counts, out=np.zeros(slots), where=counts > 0), counts
+
+    def get_typical_day_profile(self, context_key: str, device_name: str, day_type: str) -> Tuple[np.ndarray, np.ndarray]:
+        return self._day_axis(), self._day_vector(context_key, device_name, day_type)
+
+    def _day_vector(self, context_key: str, device_name: str, day_type: str) -> np.ndarray:
         config = self.get_device_config(context_key, device_name)
-        starts, ends = [], []
+        cache = self.contexts[context_key].analysis_cache if context_key in self.contexts else {}
+        cache_key = (device_name, day_type, self._config_hash(config))
+        p_vec = cache.get(cache_key)
+        if p_vec is not None:
+            self.cache_stats['hits'] += 1
+        else:
+            self.cache_stats['misses'] += 1
+            p_vec = self._prefetched.pop((context_key, cache_key), None)
+            if p_vec is None:
+                starts, ends = self._day_config(config, day_type)
+                p_vec = self.get_daily_power_vector(context_key, device_name, starts, ends)
+            # Solo lectura: el mismo arreglo se comparte entre resumen, gráficas y exportación
+            p_vec.setflags(write=False)
+            cache[cache_key] = p_vec
+        return p_vec
+
+    def _day_config(self, config: Dict, day_type: str) -> Tuple[Optional[List[str]], Optional[List[str]]]:
         if config.get('type') == 'weekly':
             sub = config.get(day_type, {})
-            starts, ends = sub.get('starts', []), sub.get('ends', [])
-        else:
-            starts, ends = config.get('starts'), config.get('ends')
-        p_vec = self.get_daily_power_vector(context_key, device_name, starts, ends)
-        base = datetime.now().date()
-        t_axis = [datetime.combine(base, time(0,0)) + timedelta(minutes=i) for i in range(1440)]
-        return t_axis, p_vec
-
-    def get_total_typical_profile(self, day_type: str, is_energy=False) -> Tuple[List[datetime], List[float]]:
-        total = [0.0] * 1440
-        time_axis = []
-        for ctx in ['hora_exacta', 'ciclos', 'escalones', 'aires']:
-            for dev in self.get_devices(ctx):
-                t, p = self.get_typical_day_profile(ctx, dev, day_type)
-                if not time_axis: time_axis = t
-                for i in range(1440):
-                    if i < len(p): total[i] += p[i]
-        if not time_axis:
-            base = datetime.now().date()
-            time_axis = [datetime.combine(base, time(0,0)) + timedelta(minutes=i) for i in range(1440)]
-        if is_energy:
-            eng = [0.0] * 1440
-            acc = 0.0
-            for i in range(1440):
-                acc += total[i] * (1.0/60000.0)
-                eng[i] = acc
-            return time_axis, eng
-        return time_axis, total
-
-    def get_weekly_power_vector(self, context_key: str, device_name: str) -> Tuple[List[str], List[float]]:
-        t_wd, p_wd = self.get_typical_day_profile(context_key, device_name, 'weekday')
-        t_we, p_we = self.get_typical_day_profile(context_key, device_name, 'weekend')
-        w_p, w_t = [], []
-        base = datetime.now().date()
-        base = base - timedelta(days=base.weekday())
-        curr = datetime.combine(base, time(0,0))
-        for d in range(7):
-            prof = p_wd if d < 5 else p_we
-            w_p.extend(prof)
-            for _ in range(1440):
-                w_t.append(curr)
-                curr += timedelta(minutes=1)
-        return w_t, w_p
-
-    def get_total_weekly_vector(self, is_energy=False) -> Tuple[List[str], List[float]]:
-        tot = [0.0] * 10080
-        tm = []
-        for ctx in ['hora_exacta', 'ciclos', 'escalones', 'aires']:
-            for dev in self.get_devices(ctx):
-                t, p = self.get_weekly_power_vector(ctx, dev)
-                if not tm: tm = t
-                for i in range(min(len(tot), len(p))): tot[i] += p[i]
-        if not tm:
-            base = datetime.now().date()
-            base = base - timedelta(days=base.weekday())
-            curr = datetime.combine(base, time(0,0))
-            for _ in range(10080):
-                tm.append(curr)
-                curr += timedelta(minutes=1)
-        if is_energy:
-            eng = [0.0]*10080
-            acc = 0.0
-            for i in range(10080):
-                acc += tot[i] * (1.0/60000.0)
-                eng[i] = acc
-            return tm, eng
-        return tm, tot
-
-    def _generate_step_profile(self, nominal_val_str, base_date, start_times, end_times):
-        timeline = []
-        current = datetime.combine(base_date, time(0,0))
-        end_of_day = current + timedelta(hours=24)
-        while current < end_of_day:
-            timeline.append({'dt': current, 'str': current.strftime("%d/%m/%Y %H:%M:%S"), 'val': "0"})
-            current += timedelta(minutes=1)
-        if not start_times: return [(t['dt'], t['str'], t['val']) for t in timeline]
-        for i in range(len(start_times)):
+            return sub.get('starts', []), sub.get('ends', [])
+        return config.get('starts'), config.get('ends')
+
+    def get_daily_energy(self, context_key: str, device_name: str, day_type: str) -> float:
+        # kWh de un día típico
+        if context_key == 'escalones' and context_key in self.contexts:
+            starts, ends = self._day_config(self.get_device_config(context_key, device_name), day_type)
+            if starts is not None and ends is not None:
+                # Escalones: analítico (minutos encendido x potencia nominal), sin armar la línea de tiempo
+                nominal = self._get_series(context_key, device_name).nominal
+                return self._step_energy(nominal, self._step_intervals(starts, ends))
+        return float(self._day_vector(context_key, device_name, day_type).sum()) * self.get_slot_energy_factor()
+
+    # --- MATRIZ DE PERFILES ---
+    def get_profile_matrix(self) -> ProfileMatrix:
+        return self.get_analysis_snapshot().matrix
+
+    def get_section_profile(self, context_key: str, day_type: str) -> np.ndarray:
+        # Subtotal de potencia (W por minuto) de una sección
+        return self.get_profile_matrix().section_total(context_key, day_type)
+
+    def get_total_typical_profile(self, day_type: str, is_energy=False) -> Tuple[np.ndarray, np.ndarray]:
+        total = self.get_profile_matrix().totals[day_type]
+        if is_energy: return self._day_axis(), np.cumsum(total * self.get_slot_energy_factor())
+        return self._day_axis(), total
+
+    def get_weekly_power_vector(self, context_key: str, device_name: str) -> Tuple[np.ndarray, np.ndarray]:
+        p_wd = self._day_vector(context_key, device_name, 'weekday')
+        p_we = self._day_vector(context_key, device_name, 'weekend')
+        return self._week_axis(), np.concatenate([p_wd] * 5 + [p_we] * 2)
+
+    def get_total_weekly_vector(self, is_energy=False) -> Tuple[np.ndarray, np.ndarray]:
+        totals = self.get_profile_matrix().totals
+        tot = np.concatenate([totals['weekday']] * 5 + [totals['weekend']] * 2)
+        if is_energy: return self._week_axis(), np.cumsum(tot * self.get_slot_energy_factor())
+        return self._week_axis(), tot
+
+    # --- SIMULACIÓN DE CALENDARIO ---
+    def simulate_calendar(self, start, end) -> CalendarSimulation:
+        # Perfiles típicos expandidos día a día sobre fechas reales (ambos extremos incluidos):
+        # sábados, domingos y festivos usan el perfil de fin de semana
+        start, end = self._as_day(start), self._as_day(end)
+        if end < start: raise CSVServiceError("El período termina antes de empezar.")
+        matrix = self.get_profile_matrix()
+        key = (matrix.generation, start, end, frozenset(self.HOLIDAYS))
+        if self._simulation is None or self._simulation[0] != key:
+            dates = np.arange(start, end + 1)
+            weekend = ~np.is_busday(dates, weekmask='1111100', holidays=sorted(self.HOLIDAYS))
+            self._simulation = (key, CalendarSimulation(matrix, dates, weekend, self.RESOLUTION))
+        return self._simulation[1]
+
+    def get_billing_period_energy(self, start, end) -> float:
+        # kWh simulados para los días reales de un período de facturación
+        return round(self.simulate_calendar(start, end).total_energy(), 4)
+
+    def _as_day(self, value) -> np.datetime64:
+        if isinstance(value, str):
+            try: value = datetime.strptime(value.strip(), "%d/%m/%Y")
+            except ValueError: raise CSVServiceError(f"Fecha inválida (dd/mm/aaaa): {value}")
+        if isinstance(value, datetime): value = value.date()
+        if not isinstance(value, (date, np.datetime64)): raise CSVServiceError(f"Fecha inválida: {value}")
+        return np.datetime64(value, 'D')
+
+    # --- EJES DE TIEMPO ---
+    def _day_axis(self) -> np.ndarray:
+        # Ranuras de hoy
+        return self._shared_axis('day', np.datetime64(datetime.now().date(), 's'), self._slots())
+
+    def _week_axis(self) -> np.ndarray:
+        # Ranuras de la semana actual, desde el lunes
+        today = datetime.now().date()
+        return self._shared_axis('week', np.datetime64(today - timedelta(days=today.weekday()), 's'), 7 * self._slots())
+
+    def _shared_axis(self, kind: str, start: np.datetime64, slots: int) -> np.ndarray:
+        # Un solo arreglo por tipo, compartido por gráficas y exportación; se renueva al cambiar de día
+        # (set_resolution vacía estos ejes)
+        axis = self._axes.get(kind)
+        if axis is None or axis[0] != start:
+            axis = start + np.arange(slots) * self.RESOLUTION
+            axis.setflags(write=False)
+            self._axes[kind] = axis
+        return axis
+
+    def _slot_labels(self) -> List[str]:
+        # HH:MM (HH:MM:SS bajo el minuto) de cada ranura del día, para las hojas de exportación
+        if 'labels' not in self._axes:
+            secs = range(0, 86400, self.RESOLUTION)
+            if self.RESOLUTION < 60: labels = [f"{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}" for s in secs]
+            else: labels = [f"{s // 3600:02d}:{s // 60 % 60:02d}" for s in secs]
+            self._axes['labels'] = labels
+        return self._axes['labels']
+
+    def _generate_step_profile(self, nominal: float, base_date, start_times, end_times) -> DayProfile:
+        timeline = np.zeros(1440)
+        for s, e in self._step_intervals(start_times, end_times): timeline[s:e] = nominal
+        return DayProfile.minute_grid(base_date, timeline)
+
+    def _step_intervals(self, start_times, end_times) -> List[Tuple[int, int]]:
+        # Intervalos [inicio, fin) en minutos del día; los que cruzan medianoche se parten en dos
+        intervals = []
+        for i in range(len(start_times or [])):
             if i >= len(end_times): break
             try:
                 t_s = datetime.strptime(start_times[i], "%H:%M").time()
                 t_e = datetime.strptime(end_times[i], "%H:%M").time()
-                dt_s = datetime.combine(base_date, t_s)
-                dt_e = datetime.combine(base_date, t_e)
-                if dt_e < dt_s:
-                    dt_end_day = datetime.combine(base_date, time(23,59,59))
-                    dt_start_day = datetime.combine(base_date, time(0,0))
-                    for p in timeline:
-                        if dt_s <= p['dt'] <= dt_end_day: p['val'] = nominal_val_str
-                        if dt_start_day <= p['dt'] < dt_e: p['val'] = nominal_val_str
-                else:
-                    for p in timeline:
-                        if dt_s <= p['dt'] < dt_e: p['val'] = nominal_val_str
             except: continue
-        return [(t['dt'], t['str'], t['val']) for t in timeline]
+            s, e = t_s.hour * 60 + t_s.minute, t_e.hour * 60 + t_e.minute
+            if e < s: intervals.extend([(s, 1440), (0, e)])
+            elif e > s: intervals.append((s, e))
+        return intervals
+
+    def _step_energy(self, nominal: float, intervals: List[Tuple[int, int]]) -> float:
+        # Minutos cubiertos por la unión de los intervalos (los solapes no se cuentan dos veces)
+        minutes, reach = 0, 0
+        for s, e in sorted(intervals):
+            s = max(s, reach)
+            if e > s:
+                minutes += e - s
+                reach = e
+        return minutes * nominal / 60000.0
 
-    def _apply_multi_cycle_day(self, raw_data, start_times_str):
-        if not raw_data: return []
-        target_times = []
+    def _apply_multi_cycle_day(self, series: DeviceSeries, start_times_str) -> DayProfile:
+        if not len(series): return DayProfile(datetime.now().date())
+        target_secs = []
         for t in start_times_str:
             try:
                 try: tt = datetime.strptime(t, "%H:%M").time()
                 except: tt = datetime.strptime(t, "%H:%M:%S").time()
-                target_times.append(tt)
+                target_secs.append(tt.hour * 3600 + tt.minute * 60 + tt.second)
             except: continue
-        base = raw_data[0][0].date()
-        day_s = datetime.combine(base, time(0,0))
-        day_e = day_s + timedelta(hours=24)
-        if not target_times:
-            zeros = []
-            curr = day_s
-            while curr < day_e:
-                zeros.append((curr, curr.strftime("%d/%m/%Y %H:%M:%S"), "0"))
-                curr += timedelta(minutes=1)
-            return zeros
-        target_times.sort()
-        cycle_dur = raw_data[-1][0] - raw_data[0][0]
-        orig_first = raw_data[0][0]
-        active_ranges = []
-        for t in target_times:
-            start = datetime.combine(base, t)
-            end = start + cycle_dur
-            if end > day_e:
-                active_ranges.append((start, day_e))
-                active_ranges.append((day_s, day_s + (end - day_e)))
-            else:
-                active_ranges.append((start, end))
-        final_rows = []
-        curr = day_s
-        while curr < day_e:
-            is_active = False
-            for s, e in active_ranges:
-                if s <= curr <= e: is_active = True; break
-            if not is_active: final_rows.append((curr, curr.strftime("%d/%m/%Y %H:%M:%S"), "0"))
-            curr += timedelta(minutes=1)
-        for t in target_times:
-            cycle_start = datetime.combine(base, t)
-            offset = cycle_start - orig_first
-            for dt, _, val in raw_data:
-                new_dt = dt + offset
-                while new_dt >= day_e: new_dt -= timedelta(hours=24)
-                while new_dt < day_s: new_dt += timedelta(hours=24)
-                final_rows.append((new_dt, new_dt.strftime("%d/%m/%Y %H:%M:%S"), val))
-        final_rows.sort(key=lambda x: x[0])
-        return final_rows
+        base = series.times[0].astype('datetime64[D]')
+        if not target_secs: return DayProfile.minute_grid(base, np.zeros(1440))
+        target_secs.sort()
+        # Segundos de cada muestra desde la primera (el ciclo completo se copia en cada arranque)
+        rel = (series.times - series.times[0]).astype(np.int64)
+        cycle_dur = int(rel[-1])
+
+        # Solape entre ciclos (CYCLE_OVERLAP):
+        #   'mean'      -> las muestras que caen en el mismo minuto se promedian (comportamiento histórico)
+        #   'sum'       -> los ciclos superpuestos se suman minuto a minuto
+        #   'overwrite' -> en cada minuto queda el ciclo con el arranque más tardío del día
+        if self.CYCLE_OVERLAP in ('sum', 'overwrite'):
+            grid = np.zeros(1440)
+            rel_v, vals_v = rel[series.valid], series.values[series.valid]
+            for start in target_secs:
+                minute_idx = ((rel_v + start) % 86400) // 60
+                sums = np.bincount(minute_idx, weights=vals_v, minlength=1440)
+                counts = np.bincount(minute_idx, minlength=1440)
+                has = counts > 0
+                if self.CYCLE_OVERLAP == 'sum': grid[has] += sums[has] / counts[has]
+                else: grid[has] = sums[has] / counts[has]
+            return DayProfile.minute_grid(base, grid)
+
+        # Minutos activos: dentro de [arranque, arranque + duración] módulo 24 h (extremos incluidos)
+        minute_secs = np.arange(1440, dtype=np.int64) * 60
+        starts = np.array(target_secs, dtype=np.int64)[:, None]
+        diff = minute_secs - starts
+        wraps = starts + cycle_dur > 86400
+        active = np.where(diff >= 0, diff <= cycle_dur, wraps & (diff + 86400 <= cycle_dur)).any(axis=0)
+        zero_secs = minute_secs[~active]
+        offsets = np.concatenate([zero_secs] + [(rel + start) % 86400 for start in target_secs])
+        values = np.concatenate([np.zeros(len(zero_secs))] + [series.values] * len(target_secs))
+        order = np.argsort(offsets, kind='stable')
+        return DayProfile(base, offsets[order], values[order])
 
     def get_device_statistics(self, context_key: str, device_name: str) -> Dict: return {}
     def get_all_statistics(self, context_key: str) -> Dict: return {}
     
-    def export_report(self, filename: str, figures: Dict[str, Any] = None, bill_real: float = 0.0):
+    def export_report(self, filename: str, figures: Dict[str, Any] = None, bill_real: float = 0.0, bill_period: Tuple = None):
         import pandas as pd
         import openpyxl
         from openpyxl.drawing.image import Image as ExcelImage
         import io
-        rows_data, totals = self.get_energy_summary()
+        snap = self.get_analysis_snapshot()
+        rows_data, totals = [dict(r) for r in snap.summary_rows], snap.totals
         df_weekly = pd.DataFrame(rows_data)
         if 'section' in df_weekly.columns: df_weekly = df_weekly.drop(columns=['section'])
         df_weekly = df_weekly.rename(columns={
@@ -668,7 +1144,7 @@ class CSVController:
         }
         df_weekly = pd.concat([df_weekly, pd.DataFrame([total_row])], ignore_index=True)
 
-        monthly_rows, monthly_total = self.get_monthly_projection()
+        monthly_rows, monthly_total = snap.monthly_rows, snap.monthly_total
         processed_monthly = []
         for r in monthly_rows:
             processed_monthly.append({
@@ -682,29 +1158,27 @@ class CSVController:
         }
         df_monthly = pd.concat([df_monthly, pd.DataFrame([row_tot_month])], ignore_index=True)
 
-        diff = abs(monthly_total - bill_real)
+        # Con período de facturación se compara contra sus días reales; si no, contra el mes de 4 semanas
+        calc_total, calc_label = monthly_total, "Energía Calculada (Mes)"
+        if bill_period:
+            calc_total = self.get_billing_period_energy(*bill_period)
+            calc_label = f"Energía Calculada ({len(self.simulate_calendar(*bill_period).dates)} días)"
+        diff = abs(calc_total - bill_real)
         perc = (diff / bill_real * 100) if bill_real > 0 else 0.0
         perc_str = f"{perc:.2f}".replace('.', ',') + "%"
         df_bill = pd.DataFrame({
-            "Concepto": ["Energía Calculada (Mes)", "Energía Factura (Real)", "Diferencia (Absoluta)", "Diferencia Relativa"],
-            "Valor": [monthly_total, bill_real, diff, perc_str],
+            "Concepto": [calc_label, "Energía Factura (Real)", "Diferencia (Absoluta)", "Diferencia Relativa"],
+            "Valor": [calc_total, bill_real, diff, perc_str],
             "Unidad": ["kWh", "kWh", "kWh", "-"]
         })
 
-        base_24h = datetime.now().date()
-        time_24h = [datetime.combine(base_24h, time(0,0)) + timedelta(minutes=i) for i in range(1440)]
-        str_time = [t.strftime("%H:%M") for t in time_24h]
+        str_time = self._slot_labels()
         data_lv = {"Hora": str_time}; data_sd = {"Hora": str_time}
-        total_lv = [0.0]*1440; total_sd = [0.0]*1440
-        for ctx in ['hora_exacta', 'ciclos', 'escalones', 'aires']:
-            for dev in self.get_devices(ctx):
-                _, p_wd = self.get_typical_day_profile(ctx, dev, 'weekday')
-                _, p_we = self.get_typical_day_profile(ctx, dev, 'weekend')
-                col_name = f"{dev} [W]"
-                data_lv[col_name] = p_wd; data_sd[col_name] = p_we
-                for i in range(1440):
-                    total_lv[i] += p_wd[i]; total_sd[i] += p_we[i]
-        data_lv["TOTAL [W]"] = total_lv; data_sd["TOTAL [W]"] = total_sd
+        matrix = snap.matrix
+        for i, (_, dev) in enumerate(matrix.keys):
+            col_name = f"{dev} [W]"
+            data_lv[col_name] = matrix.weekday[i]; data_sd[col_name] = matrix.weekend[i]
+        data_lv["TOTAL [W]"] = matrix.totals['weekday']; data_sd["TOTAL [W]"] = matrix.totals['weekend']
         df_lv = pd.DataFrame(data_lv); df_sd = pd.DataFrame(data_sd)
 
         try:
@@ -747,12 +1221,80 @@ class CSVController:
     def save_project_state(self, filepath: str):
         import pickle
         try:
-            with open(filepath, 'wb') as f: pickle.dump(self.contexts, f)
+            # Contextos y festivos; los archivos anteriores traen solo el dict de contextos
+            state = {'contexts': self.contexts, 'holidays': sorted(self.HOLIDAYS)}
+            with open(filepath, 'wb') as f: pickle.dump(state, f)
         except Exception as e: raise CSVServiceError(f"Error al guardar: {e}")
     def load_project_state(self, filepath: str):
         import pickle
         try:
             with open(filepath, 'rb') as f:
                 loaded = pickle.load(f)
-            if isinstance(loaded, dict): self.contexts = loaded
-        except Exception as e: raise CSVServiceError(f"Error al cargar: {e}")
\ No newline at end of file
+            if isinstance(loaded, dict):
+                if isinstance(loaded.get('contexts'), dict):
+                    self.contexts = loaded['contexts']
+                    self.HOLIDAYS = set(loaded.get('holidays', ()))
+                else:
+                    self.contexts = loaded
+                    self.HOLIDAYS = set()
+                self.generation += 1
+                self._structure_generation = self.generation
+        except Exception as e: raise CSVServiceError(f"Error al cargar: {e}")
+
+
+# =========================================================================
+#  PROCESOS DE CÁLCULO DE PERFILES
+# =========================================================================
+# (llamada, controlador) vigente y (nombre, bloque, series) mapeado en este proceso
+_PROFILE_CALL: Optional[Tuple] = None
+_PROFILE_BLOCK: Optional[Tuple[str, shared_memory.SharedMemory, Dict]] = None
+
+def _attach_profile_block(state: Dict) -> Dict:
+    # Series de solo lectura sobre el bloque compartido; se reutilizan mientras el bloque sea el mismo
+    global _PROFILE_BLOCK
+    if _PROFILE_BLOCK is None or _PROFILE_BLOCK[0] != state['block']:
+        if _PROFILE_BLOCK is not None: _PROFILE_BLOCK[1].close()
+        _PROFILE_BLOCK = None
+        shm = shared_memory.SharedMemory(name=state['block'])
+        total = state['total']
+        times = np.ndarray(total, dtype=np.int64, buffer=shm.buf).view('datetime64[s]')
+        values = np.ndarray(total, dtype=np.float64, buffer=shm.buf, offset=total * 8)
+        times.setflags(write=False)
+        values.setflags(write=False)
+        series = {}
+        for k, parts in state['contexts'].items():
+            for dev, (pos, n, nominal, failed) in parts['series'].items():
+                series[k, dev] = DeviceSeries(times[pos:pos + n], values[pos:pos + n], nominal=nominal, failed_rows=failed)
+        _PROFILE_BLOCK = (state['block'], shm, series)
+    return _PROFILE_BLOCK[2]
+
+def _profile_worker_for(state: Dict) -> CSVController:
+    # Controlador mínimo por proceso (sin mensaje de arranque ni caché en disco), rehecho en cada llamada al pool
+    global _PROFILE_CALL
+    if _PROFILE_CALL is not None and _PROFILE_CALL[0] == state['call']: return _PROFILE_CALL[1]
+    series = _attach_profile_block(state)
+    worker = CSVController.__new__(CSVController)
+    worker.__dict__.update(state['params'])
+    worker.contexts = {}
+    for k, parts in state['contexts'].items():
+        ctx = CSVContext()
+        ctx.data = CSVData(parts['columns'])
+        ctx.device_columns, ctx.device_index = parts['device_columns'], parts['device_index']
+        ctx.device_configs, ctx.device_meta = parts['device_configs'], parts['device_meta']
+        ctx.series = {dev: series[k, dev] for dev in parts['series']}
+        worker.contexts[k] = ctx
+    worker.file_cache = None
+    worker.cache_stats = {'hits': 0, 'misses': 0}
+    worker.last_warning = None
+    _PROFILE_CALL = (state['call'], worker)
+    return worker
+
+def _profile_worker(item: Tuple[Dict, Tuple[str, str, str]]) -> Optional[np.ndarray]:
+    state, (context_key, device_name, day_type) = item
+    try:
+        worker = _profile_worker_for(state)
+        starts, ends = worker._day_config(worker.get_device_config(context_key, device_name), day_type)
+        return worker.get_daily_power_vector(context_key, device_name, starts, ends)
+    except Exception:
+        # El error se reporta al recalcularlo en serie
+        return None
@@ -1,5 +1,8 @@
+import multiprocessing
 from ui.main_window import MainWindow
 
 if __name__ == "__main__":
+    # Necesario para el pool de perfiles en los ejecutables empaquetados (Windows)
+    multiprocessing.freeze_support()
     app = MainWindow()
-    app.run()
\ No newline at end of file
+    app.run()
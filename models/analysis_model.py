@@ -0,0 +1,111 @@
+from typing import Dict, List, Tuple
+import numpy as np
+
+class ProfileMatrix:
+    """
+    Perfiles típicos de todos los dispositivos en matrices densas (una por tipo de día):
+      - keys: [(contexto, dispositivo)] en el orden del resumen; la fila i es keys[i]
+      - weekday / weekend: float64 (dispositivos x ranuras del día), potencia media en W por ranura
+      - totals[day_type]: suma de todas las filas (una sola reducción al armar la matriz,
+        o los totales ya ajustados cuando solo cambiaron algunas filas)
+      - generation: generación del controlador con la que se armó
+    """
+    def __init__(self, keys: List[Tuple[str, str]], weekday: np.ndarray, weekend: np.ndarray, generation: int = 0,
+                 totals: Dict[str, np.ndarray] = None):
+        self.keys = list(keys)
+        self.index: Dict[Tuple[str, str], int] = {k: i for i, k in enumerate(self.keys)}
+        self.weekday = weekday
+        self.weekend = weekend
+        self.generation = generation
+        self.totals = totals or {'weekday': weekday.sum(axis=0), 'weekend': weekend.sum(axis=0)}
+        for arr in (weekday, weekend, *self.totals.values()): arr.setflags(write=False)
+
+    def matrix(self, day_type: str) -> np.ndarray:
+        return self.weekday if day_type == 'weekday' else self.weekend
+
+    def row(self, context_key: str, device_name: str, day_type: str) -> np.ndarray:
+        return self.matrix(day_type)[self.index[(context_key, device_name)]]
+
+    def section_total(self, context_key: str, day_type: str) -> np.ndarray:
+        rows = [i for i, (k, _) in enumerate(self.keys) if k == context_key]
+        return self.matrix(day_type)[rows].sum(axis=0)
+
+
+class AnalysisSnapshot:
+    """
+    Resultado completo del análisis para una generación de datos/configuración (no se modifica):
+      - matrix: ProfileMatrix con los perfiles típicos de cada dispositivo
+      - energy: kWh de un día típico por dispositivo (fila = matrix.keys; columnas laboral / fin de semana)
+      - energy_totals: suma sin redondear de cada columna de energy
+      - summary_rows / totals: resumen semanal (mismo formato que get_energy_summary)
+      - monthly_rows / monthly_total: proyección mensual ordenada para el Pareto
+    Los consumidores reciben copias de las filas; los arreglos son de solo lectura.
+    Los acumulados sin redondear permiten derivar un snapshot nuevo aplicando solo la diferencia
+    de los perfiles que cambiaron.
+    """
+    def __init__(self, generation: int, matrix: ProfileMatrix, energy: np.ndarray, energy_totals: np.ndarray,
+                 summary_rows: List[Dict], totals: Dict[str, float], monthly_rows: List[Dict], monthly_total: float):
+        self.generation = generation
+        self.matrix = matrix
+        self.energy = energy
+        self.energy_totals = energy_totals
+        self.summary_rows = tuple(summary_rows)
+        self.totals = dict(totals)
+        self.monthly_rows = tuple(monthly_rows)
+        self.monthly_total = monthly_total
+        for arr in (energy, energy_totals): arr.setflags(write=False)
+
+
+class CalendarSimulation:
+    """
+    Perfiles típicos expandidos sobre un rango real de fechas (ambos extremos incluidos):
+      - keys: [(contexto, dispositivo)] como en la ProfileMatrix de origen
+      - dates: datetime64[D] de cada día simulado
+      - weekend: True si el día usa el perfil de fin de semana (sábado, domingo o festivo)
+      - resolution: segundos por ranura
+      - daily_energy: kWh por dispositivo y día (float64, dispositivos x días)
+    Las series largas de potencia se arman solo al pedirlas, en float32.
+    """
+    def __init__(self, matrix: ProfileMatrix, dates: np.ndarray, weekend: np.ndarray, resolution: int):
+        self.keys = matrix.keys
+        self.dates = dates
+        self.weekend = weekend
+        self.resolution = resolution
+        self._profiles = (matrix.weekday, matrix.weekend)
+        self._totals = (matrix.totals['weekday'], matrix.totals['weekend'])
+        kinds = np.stack([matrix.weekday.sum(axis=1), matrix.weekend.sum(axis=1)], axis=1) * (resolution / 3.6e6)
+        self.daily_energy = kinds[:, weekend.astype(np.intp)]
+        for arr in (dates, weekend, self.daily_energy): arr.setflags(write=False)
+
+    def axis(self) -> np.ndarray:
+        # Inicio de cada ranura del rango, datetime64[s]
+        slots = len(self.dates) * (86400 // self.resolution)
+        return self.dates[0].astype('datetime64[s]') + np.arange(slots) * self.resolution
+
+    def power(self) -> np.ndarray:
+        # Potencia por dispositivo en todo el rango (dispositivos x ranuras), W en float32
+        wd, we = self._profiles
+        out = np.empty((len(self.keys), len(self.dates), wd.shape[1]), dtype=np.float32)
+        out[:, ~self.weekend] = wd[:, None, :]
+        out[:, self.weekend] = we[:, None, :]
+        return out.reshape(len(self.keys), -1)
+
+    def total_power(self) -> np.ndarray:
+        # Potencia total del sitio en todo el rango (una fila), W en float32
+        wd, we = self._totals
+        out = np.empty((len(self.dates), len(wd)), dtype=np.float32)
+        out[~self.weekend] = wd
+        out[self.weekend] = we
+        return out.ravel()
+
+    def total_energy(self) -> float:
+        return float(self.daily_energy.sum())
+
+    def device_energy(self) -> np.ndarray:
+        return self.daily_energy.sum(axis=1)
+
+    def month_totals(self) -> List[Tuple[str, float]]:
+        # kWh por mes calendario ('AAAA-MM'), con los días reales de cada mes dentro del rango
+        labels, idx = np.unique(self.dates.astype('datetime64[M]'), return_inverse=True)
+        totals = np.bincount(idx, weights=self.daily_energy.sum(axis=0), minlength=len(labels))
+        return [(str(m), float(t)) for m, t in zip(labels, totals)]
@@ -1,9 +1,281 @@
+from datetime import date, datetime
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+
 class CSVData:
     """
     Representa el CSV en memoria:
       - columns: lista de strings
       - rows: lista de listas (cada fila normalizada al largo de columns)
+      - encoding / delimiter: dialecto detectado al leer el archivo
+      - numeric / timestamps: representación columnar tipada y opcional
+        (un array por columna, se llena bajo demanda desde CSVService):
+          numeric[idx] -> float64 (NaN si la celda no es numérica)
+          timestamps[(idx, fmt)] -> datetime64[s] (NaT si la fecha no se pudo leer)
+          timestamp_failures[(idx, fmt)] -> filas con fecha no vacía que no se pudo leer
+      - date_formats: formato de fecha detectado por columna (idx -> fmt)
+      - source_bytes: bytes del archivo ya consumidos (offset para el modo anexar)
+      - partial_row: última fila si venía de una línea sin salto final (source_bytes queda en su
+        inicio y el modo anexar la reemplaza al releerla); None si el archivo terminaba en salto
     """
-    def __init__(self, columns=None, rows=None):
+    def __init__(self, columns=None, rows=None, encoding=None, delimiter=None):
         self.columns = columns or []
-        self.rows = rows or []
\ No newline at end of file
+        self.rows = rows or []
+        self.encoding = encoding
+        self.delimiter = delimiter
+        self.source_bytes = 0
+        self.partial_row: Optional[List[str]] = None
+        self.numeric: Dict[int, np.ndarray] = {}
+        self.timestamps: Dict[Tuple[int, str], np.ndarray] = {}
+        self.timestamp_failures: Dict[Tuple[int, str], int] = {}
+        self.date_formats: Dict[int, str] = {}
+
+    def column(self, idx: int) -> List[str]:
+        return [row[idx] if idx < len(row) else "" for row in self.rows]
+
+    def select(self, indices: Iterable[int]) -> List[List[str]]:
+        return [self.column(idx) for idx in indices]
+
+    def append_rows(self, rows: List[List[str]]):
+        self.rows.extend(rows)
+
+    def drop_last_row(self):
+        if self.rows: self.rows.pop()
+
+    def __setstate__(self, state):
+        # Proyectos guardados con versiones anteriores no traen los atributos nuevos
+        self.__init__()
+        self.__dict__.update(state)
+
+
+class LazyCSVData(CSVData):
+    """
+    CSVData cuyas columnas de texto se materializan bajo demanda:
+      - load_columns(indices) -> {idx: lista de strings} lee solo las columnas pedidas
+      - rows se materializa completo únicamente si alguien lo pide
+    """
+    def __init__(self, columns, encoding, delimiter, load_columns: Callable[[List[int]], Dict[int, List[str]]]):
+        self._rows = None
+        self._columns: Dict[int, List[str]] = {}
+        self._tail: List[List[str]] = []
+        # Filas quitadas del final de la fuente (fila sin terminar reemplazada por el modo anexar)
+        self._dropped = 0
+        super().__init__(columns=columns, encoding=encoding, delimiter=delimiter)
+        self._load_columns = load_columns
+
+    @property
+    def rows(self):
+        if self._rows is None:
+            cols = self.select(range(len(self.columns)))
+            self._rows = [list(r) for r in zip(*cols)]
+            self._columns.clear()
+            self._tail = []
+        return self._rows
+
+    @rows.setter
+    def rows(self, value):
+        self._rows = value or None
+
+    def column(self, idx: int) -> List[str]:
+        return self.select([idx])[0]
+
+    def select(self, indices: Iterable[int]) -> List[List[str]]:
+        indices = list(indices)
+        if self._rows is not None: return [CSVData.column(self, i) for i in indices]
+        missing = [i for i in dict.fromkeys(indices) if i not in self._columns]
+        if missing: self._columns.update(self._fetch(missing))
+        return [self._columns[i] for i in indices]
+
+    def _fetch(self, indices: List[int]) -> Dict[int, List[str]]:
+        # Lee columnas de la fuente sin guardarlas, con las filas quitadas y anexadas después de crearla
+        loaded = self._load_columns(indices)
+        for i in indices:
+            if self._dropped: del loaded[i][len(loaded[i]) - self._dropped:]
+            loaded[i].extend(r[i] for r in self._tail)
+        return loaded
+
+    def append_rows(self, rows: List[List[str]]):
+        if self._rows is not None:
+            self._rows.extend(rows)
+            return
+        self._tail.extend(rows)
+        for i, col in self._columns.items(): col.extend(r[i] for r in rows)
+
+    def drop_last_row(self):
+        if self._rows is not None:
+            if self._rows: self._rows.pop()
+            return
+        if self._tail: self._tail.pop()
+        else: self._dropped += 1
+        for col in self._columns.values():
+            if col: col.pop()
+
+    def __reduce__(self):
+        # Al guardar el proyecto se persiste como un CSVData normal (la fuente perezosa no es serializable).
+        # Sin filas materializadas solo se guardan las columnas con representación tipada (las de los
+        # dispositivos) y el resto queda vacío; se leen sin quedar en memoria después de guardar
+        rows = self._rows
+        if rows is None:
+            typed = set(self.numeric) | {i for i, _ in self.timestamps}
+            cols = {i: self._columns[i] for i in typed if i in self._columns}
+            pending = [i for i in sorted(typed) if i not in cols]
+            if pending: cols.update(self._fetch(pending))
+            n_rows = max((len(col) for col in cols.values()), default=0)
+            blank = [""] * n_rows
+            rows = [list(r) for r in zip(*(cols.get(i, blank) for i in range(len(self.columns))))] if n_rows else []
+        state = {'columns': self.columns, 'rows': rows, 'encoding': self.encoding, 'delimiter': self.delimiter,
+                 'numeric': self.numeric, 'timestamps': self.timestamps, 'timestamp_failures': self.timestamp_failures,
+                 'date_formats': self.date_formats, 'source_bytes': self.source_bytes, 'partial_row': self.partial_row}
+        return (CSVData, (), state)
+
+
+class MappedCSVData(LazyCSVData):
+    """
+    LazyCSVData respaldado por un mmap del archivo (archivos muy grandes):
+      - starts / ends: límites en bytes de cada fila de datos (sin encabezado ni líneas vacías)
+      - cada pasada decodifica las líneas y conserva solo las columnas pedidas
+    """
+    def __init__(self, columns, encoding, delimiter, buffer, starts: np.ndarray, ends: np.ndarray,
+                 parse_lines: Callable[[Iterable[str]], Iterator[List[str]]]):
+        super().__init__(columns, encoding, delimiter, self._read_columns)
+        self._buffer = buffer
+        self._starts = starts
+        self._ends = ends
+        self._parse_lines = parse_lines
+
+    def _read_columns(self, indices: List[int]) -> Dict[int, List[str]]:
+        # Una sola pasada sobre el archivo para todas las columnas pedidas
+        cols = {i: [] for i in indices}
+        for row in self._parse_lines(self._iter_lines()):
+            for i in indices: cols[i].append(row[i] if i < len(row) else "")
+        return cols
+
+    def _iter_lines(self) -> Iterator[str]:
+        buf, enc = self._buffer, self.encoding
+        for s, e in zip(self._starts.tolist(), self._ends.tolist()):
+            yield buf[s:e].decode(enc, 'csvservice.latin1').strip()
+
+
+class MinuteAggregate:
+    """
+    Agregado por minuto de una serie de alta frecuencia (las muestras no se conservan):
+      - minutes: datetime64[m] ordenado, un registro por minuto con muestras de fecha válida
+      - sums / counts: suma y cantidad de valores numéricos del minuto
+      - mins / maxs: mínimo y máximo del minuto (NaN si no hubo valores numéricos)
+      - lasts / last_at: valor (NaN si no es numérico) y fecha (datetime64[s]) de la última muestra del
+        minuto; a igual fecha gana la que viene después en el archivo
+      - peak: máximo numérico de todo lo leído (potencia nominal; NaN si no hubo valores)
+      - failed_rows: filas con fecha no vacía que no se pudo leer
+    Los agregados parciales (bloques del archivo, filas anexadas) se combinan sin perder exactitud.
+    """
+    def __init__(self, minutes=None, sums=None, counts=None, mins=None, maxs=None, peak=np.nan, failed_rows=0,
+                 lasts=None, last_at=None):
+        self.minutes = minutes if minutes is not None else np.empty(0, dtype='datetime64[m]')
+        self.sums = sums if sums is not None else np.empty(0)
+        self.counts = counts if counts is not None else np.empty(0, dtype=np.int64)
+        self.mins = mins if mins is not None else np.empty(0)
+        self.maxs = maxs if maxs is not None else np.empty(0)
+        self.lasts = lasts if lasts is not None else np.empty(0)
+        self.last_at = last_at if last_at is not None else np.empty(0, dtype='datetime64[s]')
+        self.peak = peak
+        self.failed_rows = failed_rows
+
+    @classmethod
+    def from_samples(cls, times: Optional[np.ndarray], values: np.ndarray, failed_rows: int = 0) -> "MinuteAggregate":
+        # times None = columna sin fecha: solo se conserva el máximo
+        if times is not None:
+            dated = ~np.isnat(times)
+            times, values = times[dated], values[dated]
+        numeric = ~np.isnan(values)
+        peak = float(values[numeric].max()) if numeric.any() else np.nan
+        if times is None: return cls(peak=peak, failed_rows=failed_rows)
+        parts = cls(times.astype('datetime64[m]'), np.where(numeric, values, 0.0), numeric.astype(np.int64),
+                    values, values, peak, failed_rows, values, times.astype('datetime64[s]'))
+        return cls.combine([parts])
+
+    @classmethod
+    def combine(cls, parts: List["MinuteAggregate"]) -> "MinuteAggregate":
+        # Reúne registros de varios agregados (pueden repetir minutos) en un registro por minuto
+        peaks = [p.peak for p in parts if p.peak == p.peak]
+        peak = max(peaks) if peaks else np.nan
+        failed = sum(p.failed_rows for p in parts)
+        minutes = np.concatenate([p.minutes for p in parts]) if parts else np.empty(0, dtype='datetime64[m]')
+        if not len(minutes): return cls(peak=peak, failed_rows=failed)
+        # Por minuto y dentro de él por fecha de la última muestra (lexsort es estable: respeta el orden de las partes)
+        order = np.lexsort((np.concatenate([p.last_at for p in parts]), minutes))
+        field = lambda name: np.concatenate([getattr(p, name) for p in parts])[order]
+        minutes = minutes[order]
+        starts = np.flatnonzero(np.r_[True, minutes[1:] != minutes[:-1]])
+        ends = np.r_[starts[1:], len(minutes)] - 1
+        return cls(minutes[starts], np.add.reduceat(field('sums'), starts), np.add.reduceat(field('counts'), starts),
+                   np.fmin.reduceat(field('mins'), starts), np.fmax.reduceat(field('maxs'), starts), peak, failed,
+                   field('lasts')[ends], field('last_at')[ends])
+
+    def __len__(self) -> int:
+        return len(self.minutes)
+
+    def means(self) -> np.ndarray:
+        return np.divide(self.sums, self.counts, out=np.full(len(self.sums), np.nan), where=self.counts > 0)
+
+
+class DeviceSeries:
+    """
+    Serie de un dispositivo ya parseada y ordenada por fecha (índice construido en la carga):
+      - times: datetime64[s] ordenado (solo filas con fecha válida, orden estable)
+      - values: float64 alineado con times (NaN si la celda no es numérica)
+      - valid: máscara de valores numéricos (se calcula una sola vez con la serie)
+      - time_strs / value_strs: texto original de cada muestra (lo que se muestra en tablas)
+      - nominal: primer valor máximo (> 0), potencia nominal de escalones
+      - failed_rows: filas descartadas porque su fecha no se pudo leer
+    """
+    def __init__(self, times=None, values=None, time_strs=None, value_strs=None, nominal=0.0, failed_rows=0):
+        self.times = times if times is not None else np.empty(0, dtype='datetime64[s]')
+        self.values = values if values is not None else np.empty(0)
+        self.valid = ~np.isnan(self.values)
+        self.time_strs: List[str] = time_strs or []
+        self.value_strs: List[str] = value_strs or []
+        self.nominal = nominal
+        self.failed_rows = failed_rows
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def datetimes(self) -> List[datetime]:
+        return self.times.astype(object).tolist()
+
+    def start_date(self) -> Optional[date]:
+        return self.times[0].astype(object).date() if len(self.times) else None
+
+
+class DayProfile:
+    """
+    Perfil tipado de un dispositivo (el texto solo se arma al mostrarlo en tabla):
+      - base: día de referencia (datetime64[D]); las muestras se ubican respecto a su medianoche
+      - offsets: segundos desde esa medianoche (int64), uno por muestra
+      - values: float64 alineado con offsets (NaN = muestra sin valor numérico)
+      - valid: máscara de valores numéricos (la de la serie si el perfil es la serie cruda)
+      - texts: (fechas, valores) originales cuando el perfil es la serie cruda del archivo
+      - gaps: resumen del relleno de huecos (nevera): missing_minutes, method, period_minutes
+      - hold: segundos que dura cada muestra (60 en perfiles por minuto; None = muestras puntuales)
+    """
+    def __init__(self, base, offsets=None, values=None, texts: Optional[Tuple[List[str], List[str]]] = None,
+                 gaps: Optional[Dict] = None, valid: Optional[np.ndarray] = None, hold: Optional[int] = None):
+        self.base = np.datetime64(base, 'D')
+        self.offsets = offsets if offsets is not None else np.empty(0, dtype=np.int64)
+        self.values = values if values is not None else np.empty(0)
+        self.valid = valid if valid is not None else ~np.isnan(self.values)
+        self.texts = texts
+        self.gaps = gaps
+        self.hold = hold
+
+    @classmethod
+    def minute_grid(cls, base, values: np.ndarray, gaps: Optional[Dict] = None) -> "DayProfile":
+        # Una muestra por minuto del día (0..1439)
+        return cls(base, np.arange(len(values), dtype=np.int64) * 60, values, gaps=gaps, hold=60)
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def slot_of_day(self, seconds: int = 60) -> np.ndarray:
+        # Ranura del día de cada muestra, con ranuras de `seconds` segundos
+        return (self.offsets // seconds) % (86400 // seconds)
@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+from typing import Iterable, Optional
+import numpy as np
+from models.csv_model import CSVData, LazyCSVData
+from services.csv_service import CSVService
+
+class ParsedFileCache:
+    """
+    Caché en disco de CSVs ya parseados (formato .npz sin comprimir: guardar debe costar
+    menos que volver a parsear).
+    - La llave es el hash del contenido del archivo + la versión del parser y del formato:
+      si el archivo o el parser cambian, la entrada simplemente deja de usarse.
+    - Guarda columnas de texto (bytes UTF-8, una celda por línea) y columnas tipadas
+      (float64 / datetime64) de los dispositivos, junto con delimitador, codificación y
+      formatos de fecha detectados.
+    - Tamaño acotado (MAX_BYTES): al superarlo se borran las entradas usadas hace más tiempo.
+    - Cualquier fallo de lectura/escritura se ignora: la caché es solo una optimización.
+    """
+
+    HASH_BLOCK_BYTES = 1024 * 1024
+    FORMAT_VERSION = 2
+    MAX_BYTES = 512 * 1024 * 1024
+
+    def __init__(self, cache_dir: Optional[str] = None):
+        self.cache_dir = cache_dir or os.path.join(os.path.expanduser("~"), ".analizador_energia", "cache")
+
+    def key_for(self, path: str) -> Optional[str]:
+        try:
+            h = hashlib.blake2b(digest_size=16)
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(self.HASH_BLOCK_BYTES), b""):
+                    h.update(block)
+        except OSError:
+            return None
+        return f"{h.hexdigest()}-v{CSVService.PARSER_VERSION}-f{self.FORMAT_VERSION}"
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def load(self, key: Optional[str]) -> Optional[CSVData]:
+        if not key: return None
+        path = self._path(key)
+        if not os.path.exists(path): return None
+        try:
+            # El archivo se cierra enseguida (un .npz abierto impide borrarlo en Windows): el texto se
+            # copia en bytes y se decodifica solo cuando se piden sus columnas
+            with np.load(path, allow_pickle=False) as npz:
+                meta = json.loads(str(npz['meta']))
+                if meta.get('parser_version') != CSVService.PARSER_VERSION: return None
+                n_rows = meta['n_rows']
+                texts = {i: npz[f"text_{i}"] for i in meta['text_columns']}
+                numeric = {i: npz[f"num_{i}"] for i in meta['numeric_columns']}
+                timestamps = {(i, fmt): (npz[f"ts_{i}"], failed) for i, fmt, failed in meta['timestamp_columns']}
+            # Uso reciente para el descarte por antigüedad
+            os.utime(path)
+
+            def load_columns(indices):
+                # Solo se guardan las columnas de dispositivos: el resto queda vacío
+                return {i: (self._decode_text(texts[i], n_rows) if i in texts else [""] * n_rows) for i in indices}
+
+            data = LazyCSVData(meta['columns'], meta['encoding'], meta['delimiter'], load_columns)
+            data.numeric.update(numeric)
+            for ts_key, (arr, failed) in timestamps.items():
+                data.timestamps[ts_key] = arr
+                data.timestamp_failures[ts_key] = failed
+            data.date_formats = {int(i): fmt for i, fmt in meta['date_formats'].items()}
+            data.source_bytes = meta['source_bytes']
+            data.partial_row = meta.get('partial_row')
+            return data
+        except Exception:
+            return None
+
+    def save(self, key: Optional[str], data: CSVData, indices: Iterable[int]):
+        if not key: return
+        indices = sorted(set(indices))
+        try:
+            arrays = {}
+            n_rows = 0
+            for i, col in zip(indices, data.select(indices)):
+                arrays[f"text_{i}"] = np.frombuffer("\n".join(col).encode("utf-8"), dtype=np.uint8)
+                n_rows = len(col)
+            numeric = [i for i in indices if i in data.numeric]
+            for i in numeric:
+                arrays[f"num_{i}"] = data.numeric[i]
+            timestamps = [(i, fmt) for (i, fmt) in data.timestamps if i in indices and data.date_formats.get(i) == fmt]
+            for i, fmt in timestamps:
+                arrays[f"ts_{i}"] = data.timestamps[(i, fmt)]
+            timestamps = [(i, fmt, data.timestamp_failures.get((i, fmt), 0)) for i, fmt in timestamps]
+            meta = {
+                'parser_version': CSVService.PARSER_VERSION, 'columns': data.columns, 'n_rows': n_rows,
+                'encoding': data.encoding, 'delimiter': data.delimiter, 'source_bytes': data.source_bytes,
+                'partial_row': data.partial_row, 'text_columns': indices,
+                'numeric_columns': numeric, 'timestamp_columns': timestamps,
+                'date_formats': {str(i): fmt for i, fmt in data.date_formats.items()}
+            }
+            arrays['meta'] = np.array(json.dumps(meta))
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Escritura atómica: un archivo a medio escribir nunca queda con el nombre final
+            tmp = self._path(key) + ".tmp"
+            with open(tmp, "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(tmp, self._path(key))
+            self._evict()
+        except Exception:
+            return
+
+    @staticmethod
+    def _decode_text(raw: np.ndarray, n_rows: int):
+        # Las celdas nunca contienen saltos de línea (el lector parte por líneas antes del CSV)
+        return raw.tobytes().decode("utf-8").split("\n") if n_rows else []
+
+    def _evict(self):
+        # Descarta las entradas usadas hace más tiempo hasta quedar bajo MAX_BYTES
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.endswith(".npz"):
+                st = os.stat(path)
+                entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.MAX_BYTES: break
+            try: os.remove(path)
+            except OSError: continue
+            total -= size
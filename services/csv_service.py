@@ -1,90 +1,434 @@
 import csv
-from typing import List
-from models.csv_model import CSVData
+import codecs
+from datetime import datetime
+from typing import Iterable, Iterator, List, Optional, Tuple
+from models.csv_model import CSVData, MappedCSVData
+import numpy as np
+import mmap
+import os
 import io
 
 class CSVServiceError(Exception):
     pass
 
+def _latin1_fallback(err: UnicodeDecodeError):
+    # Bytes inválidos para la codificación detectada en la muestra (ej: una tilde
+    # Latin-1 que aparece al final de un archivo UTF-8): se decodifican como Latin-1.
+    return err.object[err.start:err.end].decode('latin-1'), err.end
+
+codecs.register_error('csvservice.latin1', _latin1_fallback)
+
+class _BoundedReader(io.RawIOBase):
+    # Lector binario que no pasa de `limit` bytes (aunque el archivo siga creciendo)
+    def __init__(self, raw, limit: int):
+        self._raw = raw
+        self._left = limit
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        if self._left <= 0: return 0
+        n = self._raw.readinto(memoryview(b)[:self._left]) or 0
+        self._left -= n
+        return n
+
 class CSVService:
     """
     Servicio robusto para leer CSVs 'sucios'.
-    - Soporta múltiples codificaciones (UTF-8, Latin-1).
+    - Soporta múltiples codificaciones (UTF-8, Latin-1), detectadas sobre una
+      muestra acotada de bytes: el archivo completo se decodifica una sola vez.
     - Repara filas rotas por comas decimales (ej: 0,78 -> 0.78).
+    - Lectura en streaming: las filas se entregan por bloques (chunks) sin
+      cargar el archivo completo en listas intermedias.
+    - Columnas tipadas (float64 / datetime64) parseadas una sola vez y
+      guardadas en el CSVData.
+    - Archivos muy grandes: lectura vía mmap, decodificando solo las columnas pedidas.
+    - Fechas parseadas por columna completa (ruta rápida de ancho fijo, strptime
+      solo para celdas irregulares).
     """
 
+    PARSER_VERSION = 3
+    ENCODINGS = ['utf-8-sig', 'utf-8', 'latin-1', 'cp1252']
+    CHUNK_ROWS = 5000
+    SAMPLE_BYTES = 64 * 1024
+    SAMPLE_LINE_BYTES = 4096
+    MMAP_MIN_BYTES = 100 * 1024 * 1024
+    SCAN_BLOCK_BYTES = 16 * 1024 * 1024
+
     @staticmethod
     def read_csv(path: str) -> CSVData:
-        # 1. Intentar leer con diferentes codificaciones
-        encodings = ['utf-8-sig', 'utf-8', 'latin-1', 'cp1252']
-        lines = None
-        
-        for enc in encodings:
+        data, chunks = CSVService.open_stream(path)
+        for chunk in chunks:
+            data.rows.extend(chunk)
+        return data
+
+    @staticmethod
+    def open_stream(path: str, chunk_size: int = CHUNK_ROWS) -> Tuple[CSVData, Iterator[List[List[str]]]]:
+        """
+        Lee el encabezado y devuelve (data, chunks): data es un CSVData con
+        columnas, codificación y delimitador (aún sin filas) y chunks es un
+        generador de bloques de filas ya normalizadas (CASOS A/B/C).
+        """
+        encoding, delimiter, columns = CSVService._read_header(path)
+        data = CSVData(columns=columns, encoding=encoding, delimiter=delimiter)
+        chunks = CSVService._iter_chunks(path, data, chunk_size)
+        return data, chunks
+
+    @staticmethod
+    def should_map(path: str) -> bool:
+        try: return os.path.getsize(path) >= CSVService.MMAP_MIN_BYTES
+        except OSError: return False
+
+    @staticmethod
+    def read_csv_mapped(path: str) -> MappedCSVData:
+        """
+        Lector respaldado por mmap: ubica los límites de cada fila con numpy y
+        devuelve un MappedCSVData cuyas columnas se decodifican bajo demanda.
+        """
+        encoding, delimiter, columns = CSVService._read_header(path)
+        try:
+            with open(path, "rb") as f:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception as e:
+            raise CSVServiceError(f"Error de lectura: {e}")
+        starts, ends = CSVService._line_bounds(buffer)
+        # La primera línea útil es el encabezado. Una última línea sin salto también se lee, pero
+        # el offset del modo anexar queda en su inicio: la recarga la relee y reemplaza la fila
+        starts, ends = starts[1:], ends[1:]
+        complete = max(buffer.rfind(b"\n"), buffer.rfind(b"\r")) + 1
+        expected_cols = len(columns)
+        parse_lines = lambda lines: CSVService._parse_lines(lines, delimiter, expected_cols)
+        data = MappedCSVData(columns, encoding, delimiter, buffer, starts, ends, parse_lines)
+        data.source_bytes = complete
+        if len(ends) and ends[-1] >= complete:
+            line = buffer[int(starts[-1]):int(ends[-1])].decode(encoding, 'csvservice.latin1').strip()
+            data.partial_row = next(parse_lines([line]), None)
+        return data
+
+    @staticmethod
+    def sample_rows(path: str, data: CSVData, count: int) -> List[List[str]]:
+        """
+        Muestra acotada de filas repartida sobre todo el archivo: una línea completa
+        después de cada uno de `count` offsets equiespaciados (sin recorrerlo entero).
+        """
+        lines = []
+        try:
+            with open(path, "rb") as f:
+                size = f.seek(0, os.SEEK_END)
+                for pos in np.linspace(0, size, count, endpoint=False).astype(np.int64).tolist():
+                    f.seek(pos)
+                    pieces = f.read(CSVService.SAMPLE_LINE_BYTES).replace(b"\r", b"\n").split(b"\n")
+                    # La primera pieza es la línea cortada por el offset (o el encabezado) y la última puede estar incompleta
+                    line = next((p for p in pieces[1:-1] if p.strip()), None)
+                    if line is not None: lines.append(line.decode(data.encoding, 'csvservice.latin1').strip())
+        except Exception as e:
+            raise CSVServiceError(f"Error de lectura: {e}")
+        return list(CSVService._parse_lines(lines, data.delimiter, len(data.columns)))
+
+    @staticmethod
+    def read_tail(path: str, data: CSVData) -> Tuple[List[List[str]], int, Optional[List[str]]]:
+        """
+        Modo anexar: parsea solo lo escrito después de data.source_bytes.
+        Devuelve (filas nuevas, nuevo offset, fila sin terminar). Una última línea sin
+        salto (el logger la está escribiendo) se devuelve como última fila, pero el
+        offset queda en su inicio: la próxima recarga la relee y la reemplaza.
+        """
+        offset = data.source_bytes
+        try:
+            with open(path, "rb") as f:
+                f.seek(offset)
+                raw = f.read()
+        except Exception as e:
+            raise CSVServiceError(f"Error de lectura: {e}")
+        end = max(raw.rfind(b"\n"), raw.rfind(b"\r")) + 1
+        text = raw.decode(data.encoding, 'csvservice.latin1')
+        lines = (line.strip() for line in io.StringIO(text, newline=""))
+        lines = (line for line in lines if line)
+        rows = list(CSVService._parse_lines(lines, data.delimiter, len(data.columns)))
+        partial_row = rows[-1] if rows and raw[end:].strip() else None
+        return rows, offset + end, partial_row
+
+    @staticmethod
+    def drop_last_row(data: CSVData):
+        # Quita la fila sin terminar (texto y columnas tipadas) antes de anexar su versión releída
+        row = data.partial_row
+        for idx, arr in list(data.numeric.items()):
+            data.numeric[idx] = arr[:-1]
+        for (idx, fmt), arr in list(data.timestamps.items()):
+            # Una fecha no vacía que quedó en NaT se había contado como fallida
+            if len(arr) and np.isnat(arr[-1]) and idx < len(row) and row[idx].strip():
+                data.timestamp_failures[(idx, fmt)] -= 1
+            data.timestamps[(idx, fmt)] = arr[:-1]
+        data.drop_last_row()
+        data.partial_row = None
+
+    @staticmethod
+    def _line_bounds(buffer) -> Tuple[np.ndarray, np.ndarray]:
+        # Posiciones de fin de línea, buscadas por bloques para no duplicar el archivo en memoria
+        size = len(buffer)
+        view = np.frombuffer(buffer, dtype=np.uint8)
+        newline = 10 if buffer.find(b"\n") != -1 else 13
+        found = []
+        for off in range(0, size, CSVService.SCAN_BLOCK_BYTES):
+            block = view[off:off + CSVService.SCAN_BLOCK_BYTES]
+            found.append(np.flatnonzero(block == newline) + off)
+        breaks = np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+        starts = np.concatenate(([0], breaks + 1)).astype(np.int64)
+        ends = np.concatenate((breaks, [size])).astype(np.int64)
+        if buffer[:3] == codecs.BOM_UTF8: starts[0] = 3
+
+        # Descartar líneas vacías: solo hay que revisar las que empiezan con espacio en blanco
+        blank_first = np.zeros(256, dtype=bool)
+        blank_first[list(b" \t\r\n\x0b\x0c")] = True
+        lengths = ends - starts
+        first = view[np.minimum(starts, max(size - 1, 0))] if size else np.empty(0, dtype=np.uint8)
+        keep = lengths > 0
+        suspects = np.flatnonzero(keep & blank_first[first])
+        for i in suspects.tolist():
+            if not buffer[starts[i]:ends[i]].strip(): keep[i] = False
+        return starts[keep], ends[keep]
+
+    @staticmethod
+    def _read_header(path: str) -> Tuple[str, str, List[str]]:
+        # 1. Detectar codificación y primera línea útil (Header) sobre una muestra
+        encoding, header_line = CSVService._sniff_encoding(path)
+
+        # 2. Detectar delimitador basado en la primera línea (Header)
+        delimiter = CSVService._detect_delimiter(header_line)
+
+        # 3. Parsear encabezado
+        reader = csv.reader(io.StringIO(header_line), delimiter=delimiter)
+        columns = next(reader)
+        columns = [c.strip() for c in columns]
+        return encoding, delimiter, columns
+
+    @staticmethod
+    def _sniff_encoding(path: str) -> Tuple[str, str]:
+        # Leer una muestra acotada (ampliándola solo si el encabezado no cabe en ella)
+        try:
+            with open(path, "rb") as f:
+                sample = f.read(CSVService.SAMPLE_BYTES)
+                at_eof = len(sample) < CSVService.SAMPLE_BYTES
+                while not at_eof and b"\n" not in sample.lstrip():
+                    more = f.read(CSVService.SAMPLE_BYTES)
+                    at_eof = len(more) < CSVService.SAMPLE_BYTES
+                    sample += more
+        except Exception as e:
+            raise CSVServiceError(f"Error de lectura: {e}")
+
+        # Intentar decodificar la muestra con diferentes codificaciones
+        for enc in CSVService.ENCODINGS:
             try:
-                with open(path, "r", encoding=enc, newline="") as f:
-                    lines = [line.strip() for line in f.readlines() if line.strip()]
-                break # Si lee bien, salimos del bucle
+                # Decodificador incremental: un carácter multibyte cortado al final de la muestra no es error
+                text = codecs.getincrementaldecoder(enc)().decode(sample, final=at_eof)
             except UnicodeDecodeError:
                 continue
-            except Exception as e:
-                raise CSVServiceError(f"Error de lectura: {e}")
-
-        if not lines:
-            raise CSVServiceError("No se pudo leer el archivo o está vacío (revise codificación).")
+            header_line = next((line.strip() for line in io.StringIO(text, newline="") if line.strip()), None)
+            if header_line is None:
+                break
+            return enc, header_line
+        raise CSVServiceError("No se pudo leer el archivo o está vacío (revise codificación).")
 
-        # 2. Detectar delimitador basado en la primera línea (Header)
-        header_line = lines[0]
+    @staticmethod
+    def _detect_delimiter(header_line: str) -> str:
         possible_delimiters = [',', ';', '\t', '|']
-        
+
         # Contar ocurrencias y elegir el ganador
         delimiter = max(possible_delimiters, key=lambda d: header_line.count(d))
-        
+
         # Si no encontró ninguno, por defecto coma
         if header_line.count(delimiter) == 0:
             delimiter = ','
+        return delimiter
 
-        # 3. Parsear encabezado
-        reader = csv.reader(io.StringIO(header_line), delimiter=delimiter)
-        columns = next(reader)
-        columns = [c.strip() for c in columns]
-        expected_cols = len(columns)
+    @staticmethod
+    def _complete_end(f, size: int) -> int:
+        # Offset justo después del último salto de línea antes de `size` (0 si no hay ninguno)
+        pos = size
+        while pos > 0:
+            start = max(0, pos - CSVService.SAMPLE_BYTES)
+            f.seek(start)
+            block = f.read(pos - start)
+            found = max(block.rfind(b"\n"), block.rfind(b"\r"))
+            if found != -1: return start + found + 1
+            pos = start
+        return 0
 
-        # 4. Procesar filas con "Reparación de Decimales"
-        normalized_rows = []
-        
-        for line in lines[1:]:
-            # Parsear línea actual
-            row_reader = csv.reader(io.StringIO(line), delimiter=delimiter)
-            try:
-                row = next(row_reader)
-            except StopIteration:
-                continue
+    @staticmethod
+    def _iter_chunks(path: str, data: CSVData, chunk_size: int) -> Iterator[List[List[str]]]:
+        delimiter, expected_cols = data.delimiter, len(data.columns)
+        with open(path, "rb") as raw:
+            # Se lee hasta el tamaño actual (aunque el archivo siga creciendo). Una última línea
+            # sin salto también se lee, pero el modo anexar retoma desde su inicio y la reemplaza
+            size = os.fstat(raw.fileno()).st_size
+            end = CSVService._complete_end(raw, size)
+            raw.seek(end)
+            partial = bool(raw.read(size - end).strip())
+            raw.seek(0)
+            f = io.TextIOWrapper(io.BufferedReader(_BoundedReader(raw, size)), encoding=data.encoding,
+                                 errors="csvservice.latin1", newline="")
+            lines = (line.strip() for line in f)
+            lines = (line for line in lines if line)
+            next(lines, None)  # Header
+
+            chunk = []
+            row = None
+            for row in CSVService._parse_lines(lines, delimiter, expected_cols):
+                chunk.append(row)
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+            # Punto de partida para una recarga en modo anexar
+            data.source_bytes = end
+            data.partial_row = row if partial else None
+
+    @staticmethod
+    def _parse_lines(lines: Iterable[str], delimiter: str, expected_cols: int) -> Iterator[List[str]]:
+        # Cada línea por separado: una comilla sin cerrar solo afecta a su propia fila.
+        # Sin comillas, csv.reader equivale a partir por el delimitador
+        for line in lines:
+            if '"' not in line: row = line.split(delimiter)
+            else:
+                row = next(csv.reader((line,), delimiter=delimiter), None)
+                if row is None: continue
+            yield CSVService._normalize_row(row, expected_cols)
+
+    @staticmethod
+    def _normalize_row(row: List[str], expected_cols: int) -> List[str]:
+        # Procesar fila con "Reparación de Decimales"
+        row = [cell.strip() for cell in row]
+        current_cols = len(row)
+
+        # CASO A: Fila Perfecta
+        if current_cols == expected_cols:
+            return row
+
+        # CASO B: Fila Rota (Tiene más columnas de las esperadas)
+        if current_cols > expected_cols:
+            # Unimos las columnas sobrantes al final (asumiendo que es el valor decimal partido)
+            # Ejemplo: [Fecha, 0, 79] -> [Fecha, 0,79]
+            safe_part_idx = expected_cols - 1
+            new_row = row[:safe_part_idx]
+            # Unimos con coma para conservar formato visual original
+            new_row.append(",".join(row[safe_part_idx:]))
+            return new_row
+
+        # CASO C: Faltan columnas (Rellenar)
+        return row + [""] * (expected_cols - current_cols)
+
+    # --- REPRESENTACIÓN COLUMNAR ---
+    @staticmethod
+    def numeric_column(data: CSVData, idx: int) -> np.ndarray:
+        if idx not in data.numeric:
+            data.numeric[idx] = CSVService.parse_numeric(data.column(idx))
+        return data.numeric[idx]
+
+    @staticmethod
+    def timestamp_column(data: CSVData, idx: int, fmt: str) -> np.ndarray:
+        key = (idx, fmt)
+        if key not in data.timestamps:
+            data.timestamps[key], data.timestamp_failures[key] = CSVService.parse_timestamps(data.column(idx), fmt)
+        return data.timestamps[key]
+
+    @staticmethod
+    def extend_columnar(data: CSVData, new_rows: List[List[str]]):
+        # Extiende las columnas tipadas ya parseadas solo con las filas nuevas
+        for idx, arr in list(data.numeric.items()):
+            tail = CSVService.parse_numeric([r[idx] for r in new_rows])
+            data.numeric[idx] = np.concatenate((arr, tail))
+        for (idx, fmt), arr in list(data.timestamps.items()):
+            tail, failed = CSVService.parse_timestamps([r[idx] for r in new_rows], fmt)
+            data.timestamps[(idx, fmt)] = np.concatenate((arr, tail))
+            data.timestamp_failures[(idx, fmt)] = data.timestamp_failures.get((idx, fmt), 0) + failed
+
+    @staticmethod
+    def parse_numeric(values: List[str]) -> np.ndarray:
+        # Coma decimal -> punto. Las celdas vacías o no numéricas quedan como NaN
+        if not len(values): return np.empty(0)
+        arr = np.char.replace(np.asarray(values, dtype=str), ',', '.')
+        out = np.full(len(arr), np.nan)
+        filled = arr != ''
+        try:
+            out[filled] = arr[filled].astype(np.float64)
+        except ValueError:
+            for i in np.flatnonzero(filled):
+                try: out[i] = float(arr[i])
+                except ValueError: continue
+        return out
+
+    @staticmethod
+    def parse_timestamps(values: List[str], fmt: str) -> Tuple[np.ndarray, int]:
+        """
+        Parsea una columna de fechas completa. Devuelve (datetime64[s], filas fallidas).
+        - Ruta rápida: los formatos de ancho fijo (dd/mm/yyyy HH:MM:SS y variantes,
+          con o sin segundos) se leen por posición de carácter sobre todo el bloque.
+        - Solo las celdas irregulares pasan por strptime (con y sin segundos).
+        - Las fechas que no se pueden leer quedan como NaT; las celdas vacías no cuentan como fallidas.
+        """
+        arr = np.asarray(values, dtype=str)
+        out = np.full(len(arr), np.datetime64('NaT'), dtype='datetime64[s]')
+        pending = np.ones(len(arr), dtype=bool)
+        layout = CSVService._fixed_layout(fmt)
+        if layout is not None and len(arr):
+            lengths = np.char.str_len(arr)
+            for width in (19, 16):
+                idx = np.flatnonzero(lengths == width)
+                if not len(idx): continue
+                parsed, ok = CSVService._parse_fixed(arr[idx], width, *layout)
+                out[idx[ok]] = parsed[ok]
+                pending[idx[ok]] = False
+
+        short_fmt = fmt.replace(":%S", "")
+        failed = 0
+        for i in np.flatnonzero(pending).tolist():
+            v = values[i].strip()
+            if not v: continue
+            try: dt = datetime.strptime(v, fmt)
+            except ValueError:
+                try: dt = datetime.strptime(v, short_fmt)
+                except ValueError:
+                    failed += 1
+                    continue
+            out[i] = dt
+        return out, failed
+
+    @staticmethod
+    def _fixed_layout(fmt: str):
+        # (separador, día primero) si el formato es de ancho fijo; None si no
+        for sep in '/-':
+            if fmt == f"%d{sep}%m{sep}%Y %H:%M:%S": return ord(sep), True
+            if fmt == f"%m{sep}%d{sep}%Y %H:%M:%S": return ord(sep), False
+        return None
+
+    @staticmethod
+    def _parse_fixed(arr: np.ndarray, width: int, sep: int, day_first: bool) -> Tuple[np.ndarray, np.ndarray]:
+        # Cada fila es una cadena de exactamente `width` caracteres: "dd/mm/yyyy HH:MM[:SS]"
+        chars = arr.astype(f'U{width}').view(np.uint32).reshape(-1, width)
+        digit = lambda p: chars[:, p].astype(np.int32) - 48
+        two = lambda p: digit(p) * 10 + digit(p + 1)
+
+        digit_pos = [0, 1, 3, 4, 6, 7, 8, 9, 11, 12, 14, 15] + ([17, 18] if width == 19 else [])
+        ok = np.all((chars[:, digit_pos] >= 48) & (chars[:, digit_pos] <= 57), axis=1)
+        ok &= (chars[:, 2] == sep) & (chars[:, 5] == sep) & (chars[:, 10] == 32) & (chars[:, 13] == 58)
+        if width == 19: ok &= chars[:, 16] == 58
+
+        f1, f2 = two(0), two(3)
+        day, month = (f1, f2) if day_first else (f2, f1)
+        year = digit(6) * 1000 + digit(7) * 100 + two(8)
+        hour, minute = two(11), two(14)
+        second = two(17) if width == 19 else 0
+        ok &= (month >= 1) & (month <= 12) & (year >= 1) & (day >= 1) & (hour <= 23) & (minute <= 59) & (second <= 59)
+
+        # Día válido para el mes (incluye bisiestos)
+        month_start = np.where(ok, (year - 1970) * 12 + month - 1, 0).astype('datetime64[M]')
+        first_day = month_start.astype('datetime64[D]')
+        days_in_month = ((month_start + 1).astype('datetime64[D]') - first_day).astype(np.int64)
+        ok &= day <= days_in_month
 
-            row = [cell.strip() for cell in row]
-            current_cols = len(row)
-
-            # CASO A: Fila Perfecta
-            if current_cols == expected_cols:
-                normalized_rows.append(row)
-            
-            # CASO B: Fila Rota (Tiene más columnas de las esperadas)
-            elif current_cols > expected_cols:
-                # Unimos las columnas sobrantes al final (asumiendo que es el valor decimal partido)
-                # Ejemplo: [Fecha, 0, 79] -> [Fecha, 0,79]
-                new_row = []
-                safe_part_idx = expected_cols - 1 
-                new_row.extend(row[:safe_part_idx])
-                
-                rest_of_row = row[safe_part_idx:]
-                # Unimos con coma para conservar formato visual original
-                reconstructed_value = ",".join(rest_of_row) 
-                
-                new_row.append(reconstructed_value)
-                normalized_rows.append(new_row)
-
-            # CASO C: Faltan columnas (Rellenar)
-            elif current_cols < expected_cols:
-                row = row + [""] * (expected_cols - current_cols)
-                normalized_rows.append(row)
-
-        return CSVData(columns=columns, rows=normalized_rows)
\ No newline at end of file
+        day = np.where(ok, day, 1)
+        seconds = (hour * 3600 + minute * 60 + second).astype(np.int64)
+        out = (first_day + (day - 1)).astype('datetime64[s]') + seconds
+        return out, ok
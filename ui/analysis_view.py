@@ -3,6 +3,7 @@ from tkinter import ttk
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import matplotlib.dates as mdates
+import numpy as np
 from datetime import timedelta
 from ui.table_view import TableView
 
@@ -65,7 +66,8 @@ class AnalysisView(ttk.Frame):
                 for line in ax.lines:
                     cont, ind = line.contains(event)
                     if cont:
-                        x, y = line.get_data()
+                        # Coordenadas ya convertidas a números de matplotlib (los ejes son datetime64)
+                        x, y = line.get_data(orig=False)
                         idx = ind["ind"][0]
                         x_val = mdates.num2date(x[idx])
                         y_val = y[idx]
@@ -125,7 +127,7 @@ class AnalysisView(ttk.Frame):
 
             plots = 0
             def plot_one(t, y, l, c=None):
-                if t:
+                if len(t):
                     ax.plot(t, y, label=l, color=c, linewidth=1.5, picker=5)
                     if key=='total': ax.fill_between(t, y, alpha=0.1, color=c)
                     return 1
@@ -142,13 +144,8 @@ class AnalysisView(ttk.Frame):
                 for d in devs:
                     if is_weekly: t, y = self.controller.get_weekly_power_vector(key, d)
                     else: t, y = self.controller.get_typical_day_profile(key, d, day_type)
-                    if self.is_energy and y:
-                        e_vec, acc = [], 0
-                        fac = 1.0/60000.0
-                        for val in y:
-                            acc += val * fac
-                            e_vec.append(acc)
-                        y = e_vec
+                    if self.is_energy and len(y):
+                        y = np.cumsum(np.asarray(y) * self.controller.get_slot_energy_factor())
                     plots += plot_one(t, y, d)
                 ax.set_title(f"{self.title_prefix}: {key.title()}")
 
@@ -240,14 +237,27 @@ class EnergySummaryView(ttk.Frame):
         self.ent_bill_input = ttk.Entry(container, font=("Arial", 11))
         self.ent_bill_input.grid(row=1, column=1, sticky="w", padx=10)
         ttk.Label(container, text="kWh").grid(row=1, column=2, sticky="w")
+        # Período de facturación opcional: si se llena, se simulan sus días reales (con festivos)
+        ttk.Label(container, text="Período Factura (dd/mm/aaaa):", font=("Arial", 12)).grid(row=2, column=0, sticky="w", pady=10)
+        period = ttk.Frame(container)
+        period.grid(row=2, column=1, columnspan=2, sticky="w", padx=10)
+        self.ent_bill_start = ttk.Entry(period, width=12, font=("Arial", 11))
+        self.ent_bill_start.pack(side="left")
+        ttk.Label(period, text=" a ").pack(side="left")
+        self.ent_bill_end = ttk.Entry(period, width=12, font=("Arial", 11))
+        self.ent_bill_end.pack(side="left")
+        # Festivos del período (se simulan como fin de semana y se guardan con el proyecto)
+        ttk.Label(container, text="Festivos (dd/mm/aaaa, separados por coma):", font=("Arial", 12)).grid(row=3, column=0, sticky="w", pady=10)
+        self.ent_bill_holidays = ttk.Entry(container, width=40, font=("Arial", 11))
+        self.ent_bill_holidays.grid(row=3, column=1, columnspan=2, sticky="w", padx=10)
         btn_calc = ttk.Button(container, text="Calcular Diferencia", command=self.calculate_bill_diff)
-        btn_calc.grid(row=2, column=0, columnspan=3, pady=20)
+        btn_calc.grid(row=4, column=0, columnspan=3, pady=20)
         self.lbl_diff_kwh = ttk.Label(container, text="Diferencia: --- kWh", font=("Arial", 11))
-        self.lbl_diff_kwh.grid(row=3, column=0, columnspan=3, sticky="w", pady=5)
+        self.lbl_diff_kwh.grid(row=5, column=0, columnspan=3, sticky="w", pady=5)
         self.lbl_diff_perc = ttk.Label(container, text="Porcentaje de Error: --- %", font=("Arial", 11))
-        self.lbl_diff_perc.grid(row=4, column=0, columnspan=3, sticky="w", pady=5)
+        self.lbl_diff_perc.grid(row=6, column=0, columnspan=3, sticky="w", pady=5)
         self.lbl_verdict = ttk.Label(container, text="", font=("Arial", 11, "bold"))
-        self.lbl_verdict.grid(row=5, column=0, columnspan=3, sticky="w", pady=10)
+        self.lbl_verdict.grid(row=7, column=0, columnspan=3, sticky="w", pady=10)
 
     def refresh_tables(self):
         self.refresh_weekly()
@@ -346,16 +356,39 @@ class EnergySummaryView(ttk.Frame):
             self.canvas_pareto.draw()
         except Exception as e: print(f"Error charts: {e}")
 
+    def get_bill_period(self):
+        start, end = self.ent_bill_start.get().strip(), self.ent_bill_end.get().strip()
+        return (start, end) if start and end else None
+
+    def get_bill_holidays(self):
+        return [d.strip() for d in self.ent_bill_holidays.get().split(',') if d.strip()]
+
+    def set_bill_holidays(self, days):
+        self.ent_bill_holidays.delete(0, tk.END)
+        self.ent_bill_holidays.insert(0, ", ".join(days))
+
+    def apply_bill_holidays(self):
+        # Pasa los festivos del campo al controlador (fecha inválida -> CSVServiceError)
+        if hasattr(self.controller, 'set_holidays'): self.controller.set_holidays(self.get_bill_holidays())
+
     def refresh_bill_data(self):
         if not self.controller: return
         try:
-            if hasattr(self.controller, 'get_monthly_projection'):
+            period = self.get_bill_period()
+            if period and hasattr(self.controller, 'get_billing_period_energy'):
+                self.apply_bill_holidays()
+                self.var_calculated_total.set(f"{self.controller.get_billing_period_energy(*period):.2f}")
+            elif hasattr(self.controller, 'get_monthly_projection'):
                 _, grand_total = self.controller.get_monthly_projection()
                 self.var_calculated_total.set(f"{grand_total:.2f}")
-        except: pass
+        except Exception as e: self.lbl_verdict.config(text=str(e), foreground="red")
 
     def calculate_bill_diff(self):
         try:
+            period = self.get_bill_period()
+            if period:
+                self.apply_bill_holidays()
+                self.var_calculated_total.set(f"{self.controller.get_billing_period_energy(*period):.2f}")
             calc = float(self.var_calculated_total.get())
             bill = float(self.ent_bill_input.get())
             diff = abs(calc - bill)
@@ -365,4 +398,5 @@ class EnergySummaryView(ttk.Frame):
             if perc <= 10: self.lbl_verdict.config(text="✅ La simulación es PRECISA (<10%)", foreground="green")
             elif perc <= 20: self.lbl_verdict.config(text="⚠️ La simulación es ACEPTABLE (<20%)", foreground="orange")
             else: self.lbl_verdict.config(text="❌ Alta Desviación: Revise parámetros", foreground="red")
-        except ValueError: self.lbl_verdict.config(text="Ingrese un número válido", foreground="red")
\ No newline at end of file
+        except ValueError: self.lbl_verdict.config(text="Ingrese un número válido", foreground="red")
+        except Exception as e: self.lbl_verdict.config(text=str(e), foreground="red")
\ No newline at end of file
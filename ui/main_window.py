@@ -1,8 +1,10 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, simpledialog
+import os
 import sys
 import matplotlib.pyplot as plt
 from controllers.csv_controller import CSVController
+from services.csv_service import CSVServiceError
 from ui.dropdown_view import DropdownView
 from ui.table_view import TableView
 from ui.analysis_view import AnalysisView, EnergySummaryView
@@ -84,6 +86,8 @@ class MainWindow:
         btn = ttk.Button(ctrl, text="📂 Cargar CSV Hora Exacta", 
                          command=lambda: self.run_task("Cargando archivo", lambda: self.load_csv_generic('hora_exacta', self.dd_hora, self.table_hora)))
         btn.pack(side="left", padx=10, pady=10)
+        ttk.Button(ctrl, text="➕ Anexar Datos Nuevos",
+                   command=lambda: self.run_task("Anexando datos nuevos", lambda: self.append_csv_generic('hora_exacta', self.dd_hora, self.table_hora))).pack(side="left", padx=(0, 10), pady=10)
         ttk.Separator(ctrl, orient="vertical").pack(side="left", fill="y", padx=10, pady=5)
         ttk.Label(ctrl, text="Dispositivo:").pack(side="left")
         self.dd_hora = DropdownView(ctrl, on_select=lambda dev: self.show_table_dual('hora_exacta', dev, self.table_hora))
@@ -95,6 +99,12 @@ class MainWindow:
         header = ttk.Frame(self.tab_casos_especiales, relief=tk.RAISED, borderwidth=1)
         header.pack(fill="x", side="top")
         ttk.Label(header, text="Configuración Global", font=("Arial", 10, "bold")).pack(side="top", pady=5)
+        workers_f = ttk.Frame(header)
+        workers_f.pack(side="top", pady=(0, 5))
+        ttk.Label(workers_f, text="Procesos de cálculo (1 = en serie):").pack(side="left")
+        self.var_workers = tk.StringVar(value=str(max(1, self.controller.PROFILE_WORKERS)))
+        ttk.Spinbox(workers_f, from_=1, to=max(1, os.cpu_count() or 1), width=4, textvariable=self.var_workers,
+                    command=self._apply_profile_workers).pack(side="left", padx=5)
         self.sub_notebook = ttk.Notebook(self.tab_casos_especiales)
         self.sub_notebook.pack(fill="both", expand=True, padx=10, pady=10)
         self.sub_ciclos = ttk.Frame(self.sub_notebook)
@@ -104,6 +114,10 @@ class MainWindow:
         self.sub_notebook.add(self.sub_escalones, text="📈 Escalones (Semanal)")
         self._setup_escalones_view_weekly()
 
+    def _apply_profile_workers(self):
+        try: self.controller.set_profile_workers(int(self.var_workers.get()))
+        except (ValueError, CSVServiceError) as e: messagebox.showerror("Error", str(e))
+
     def _setup_ciclos_view_weekly(self):
         parent = self.sub_ciclos
         load_f = ttk.Frame(parent)
@@ -246,14 +260,23 @@ class MainWindow:
             if hasattr(self.view_energia, 'fig_pareto'): figs['Pareto'] = self.view_energia.fig_pareto
         
         bill_val = 0.0
+        bill_period = None
         try:
             if hasattr(self, 'view_energia') and hasattr(self.view_energia, 'ent_bill_input'):
                 v = self.view_energia.ent_bill_input.get()
                 if v: bill_val = float(v)
+                bill_period = self.view_energia.get_bill_period()
         except: pass
+        if hasattr(self, 'view_energia'):
+            # Festivos aparte: uno inválido no se ignora (la hoja de factura saldría con los anteriores)
+            try: self.view_energia.apply_bill_holidays()
+            except CSVServiceError as e:
+                self.view_energia.lbl_verdict.config(text=str(e), foreground="red")
+                messagebox.showerror("Error", str(e))
+                return
         
         def _do_export():
-            self.controller.export_report(path, figs, bill_val)
+            self.controller.export_report(path, figs, bill_val, bill_period)
         self.run_task(f"Generando {safe_name}...", _do_export)
 
     def load_csv_generic(self, k, d, t):
@@ -265,6 +288,13 @@ class MainWindow:
             d._combobox.set(devs[0])
             self.show_table_dual(k, devs[0], t)
 
+    def append_csv_generic(self, k, d, t):
+        # Recarga solo las filas nuevas del mismo archivo (conserva horarios configurados)
+        self.controller.reload_append(k)
+        self._refresh_analytics(k)
+        dev = d.get_selected()
+        if dev in self.controller.get_devices(k): self.show_table_dual(k, dev, t)
+
     def _load_csv_dynamic(self, key):
         path = filedialog.askopenfilename(filetypes=[("CSV", "*.csv")])
         if not path: return
@@ -337,6 +367,7 @@ class MainWindow:
             self.dd_aires._combobox.set(devs_ai[0])
             self._on_aires_device_select(devs_ai[0])
 
+        if hasattr(self, 'view_energia'): self.view_energia.set_bill_holidays(self.controller.get_holidays())
         self._refresh_analytics('hora_exacta')
         messagebox.showinfo("Éxito", "Proyecto cargado correctamente.")
 
@@ -344,6 +375,7 @@ class MainWindow:
         if messagebox.askokcancel("Salir", "¿Seguro que quieres salir?"):
             try:
                 plt.close('all')
+                self.controller.close_profile_pool()
                 self.window.destroy()
                 sys.exit(0)
             except: sys.exit(0)